@@ -7,117 +7,630 @@ Features:
 - Initialize logging using log_config.py
 - Read and filter audit logs (JSON lines)
 - CLI review: filter/search by date, action, label, email_id, etc.
-- Restore/revert actions (stubbed, with TODOs for Gmail API)
+- Restore/revert actions with batched Gmail label changes (restore_actions)
+- log_action(): records are queued and appended by a background writer;
+  call flush_audit_log() to wait for them (done automatically at exit)
 - Log all operations and errors
 - Robust error handling and clear TODOs for future GUI/Gmail API integration
 """
 
 import argparse
+import atexit
+import hashlib
 import json
+import mmap
 import os
+import queue
+import re
+import sqlite3
 import sys
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Callable, TYPE_CHECKING
+
+try:
+    import orjson  # Optional: much faster JSON decoding for large audit logs
+except ImportError:
+    orjson = None
 
 # Import logging config
 import log_config
-from gmail_api_utils import GmailEmailManager, get_gmail_service
+
+if TYPE_CHECKING:
+    # gmail_api_utils pulls in googleapiclient, which is slow to import and only
+    # needed for --restore; it is imported where it is used.
+    from gmail_api_utils import GmailEmailManager
 
 SETTINGS_PATH = "config/settings.json"
 
+# JSON5-style // and /* */ comments in settings.json. String literals are
+# matched (and kept via group 1) first, so "http://..." values survive while
+# comments trailing a value on the same line are still removed.
+_SETTINGS_COMMENT_RE = re.compile(r'("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+def _dumps_indented(obj: Any) -> bytes:
+    """Serialize obj as UTF-8, 2-space indented JSON plus a trailing newline
+    (orjson when available)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            # e.g. integers wider than 64 bits; the stdlib encoder handles them
+            pass
+    return (json.dumps(obj, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _write_stdout_bytes(data: bytes):
+    """Write raw bytes to stdout, bypassing the text layer when possible."""
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is None:
+        sys.stdout.write(data.decode("utf-8"))
+        return
+    sys.stdout.flush()
+    buffer.write(data)
+
+# Read size used when the audit log cannot be memory-mapped
+LOG_READ_CHUNK_BYTES = 1 << 20
+
+# Leading bytes of the audit log hashed to tell a rewritten log from one that
+# was only appended to
+LOG_FINGERPRINT_BYTES = 4096
+
+# Index rows inserted (and the synced offset committed) per SQLite transaction
+INDEX_SYNC_CHUNK_ROWS = 10000
+
+# Fields written by _log_audit_action, in CSV export column order
+AUDIT_LOG_FIELDS = ("timestamp", "action", "email_id", "label", "reason", "dry_run")
+
+# Output buffered by print_entries before each write to stdout
+PRINT_CHUNK_BYTES = 64 * 1024
+
+# Concurrent batchModify calls used by --restore; the workers share one
+# QuotaTokenBucket so together they stay within the Gmail per-user quota
+RESTORE_MAX_WORKERS = 4
+
+# log_action only enqueues; a background writer appends queued records in
+# one write per file once this many are pending or this much time has passed
+AUDIT_FLUSH_MAX_RECORDS = 64
+AUDIT_FLUSH_INTERVAL_SECONDS = 0.1
+
+# Longest the interpreter waits at exit for queued audit records to be written
+AUDIT_EXIT_FLUSH_TIMEOUT_SECONDS = 5.0
+
+# path -> (st_mtime_ns, st_size, parsed settings)
+_settings_cache: Dict[str, Tuple[int, int, dict]] = {}
+
 def load_settings(path: str) -> dict:
+    # Cached per path until the file's mtime or size changes: _log_audit_action
+    # runs once per restored email. The returned dict is shared, so callers
+    # must treat it as read-only.
     try:
+        st = os.stat(path)
+        cached = _settings_cache.get(path)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
         with open(path, "r") as f:
             # Strip comments if present (JSON5 style)
-            content = f.read()
-            content = "\n".join(line for line in content.splitlines() if not line.strip().startswith("//") and not line.strip().startswith("/*") and not line.strip().startswith("*") and not line.strip().endswith("*/"))
-            return json.loads(content)
+            content = _SETTINGS_COMMENT_RE.sub(r"\1", f.read())
+            settings = _json_loads(content)
+        _settings_cache[path] = (st.st_mtime_ns, st.st_size, settings)
+        return settings
     except Exception as e:
         print(f"Error loading settings: {e}")
         sys.exit(1)
 
+def _parse_ymd(day: str) -> datetime:
+    """Parse a YYYY-MM-DD string, skipping strptime for the well-formed case."""
+    if (len(day) == 10 and day[4] == "-" and day[7] == "-" and day.isascii()
+            and day[0:4].isdigit() and day[5:7].isdigit() and day[8:10].isdigit()):
+        # fromisoformat is implemented in C and, for exactly this shape,
+        # accepts the same strings as strptime("%Y-%m-%d")
+        return datetime.fromisoformat(day)
+    # Malformed input; let strptime produce the error (or parse odd forms)
+    return datetime.strptime(day, "%Y-%m-%d")
+
 def parse_date(date_str: str) -> Optional[datetime]:
-    # Accepts YYYY-MM-DD, 'today', 'yesterday'
+    # Accepts YYYY-MM-DD, 'today', 'yesterday'; returns an aware UTC midnight
     if date_str.lower() == "today":
-        return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     if date_str.lower() == "yesterday":
-        return (datetime.utcnow() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (datetime.now(timezone.utc) - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
     try:
-        return datetime.strptime(date_str, "%Y-%m-%d")
+        return _parse_ymd(date_str).replace(tzinfo=timezone.utc)
     except Exception:
         return None
 
-def load_audit_log(audit_log_path: str) -> List[Dict[str, Any]]:
-    entries = []
+def _utc_day(ts: Any) -> Optional[str]:
+    """Return the UTC YYYY-MM-DD day of an audit timestamp, or None if malformed.
+
+    Timestamps written by log_action are UTC with a "Z" suffix, so the common
+    case is a plain slice; only rows carrying an explicit offset are parsed.
+    """
+    if not isinstance(ts, str) or len(ts) < 10:
+        return None
+    tail = ts[19:]
+    if "+" not in tail and "-" not in tail:
+        return ts[:10]
+    try:
+        return datetime.fromisoformat(ts).astimezone(timezone.utc).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+def _log_fingerprint(audit_log_path: str) -> str:
+    """
+    Identify the audit log file independently of appends: its inode plus a
+    hash of its first line. A rotated or rewritten log gets a new fingerprint
+    even if it has already grown past a previously indexed size.
+    """
+    try:
+        with open(audit_log_path, "rb") as f:
+            ino = os.fstat(f.fileno()).st_ino
+            head = f.readline(LOG_FINGERPRINT_BYTES)
+    except OSError:
+        return ""
+    return f"{ino}:{hashlib.sha1(head).hexdigest()}"
+
+def _parse_log_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """Decode one audit log line, or return None if it is not a JSON object."""
+    line = line.strip()
+    # Cheap structural check first so blank, truncated or garbage lines are
+    # rejected without raising (and catching) a decode error.
+    if not (line.startswith(b"{") and line.endswith(b"}")):
+        return None
+    try:
+        return _json_loads(line)
+    except ValueError:
+        return None
+
+def _iter_log_lines(f, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+    """Yield the raw lines of a binary file without per-line str decoding.
+
+    Only the byte range [start, stop) is read; start must fall on a line
+    boundary. Regular files are memory-mapped and sliced straight out of the
+    page cache; anything that cannot be mapped (pipes, some network
+    filesystems) is read in LOG_READ_CHUNK_BYTES chunks with the partial last
+    line carried over.
+    """
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        mm = None
+    if mm is not None:
+        with mm:
+            size = len(mm) if stop is None else min(stop, len(mm))
+            pos = start
+            while pos < size:
+                end = mm.find(b"\n", pos, size)
+                if end == -1:
+                    end = size
+                yield mm[pos:end]
+                pos = end + 1
+        return
+
+    # Empty regular files also end up here (they cannot be mapped)
+    if start:
+        f.seek(start)
+    remaining = None if stop is None else stop - start
+    tail = b""
+    while remaining is None or remaining > 0:
+        chunk = f.read1(LOG_READ_CHUNK_BYTES if remaining is None else min(LOG_READ_CHUNK_BYTES, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+def iter_audit_log(audit_log_path: str, needles: Iterable[bytes] = (),
+                   start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yield audit log entries one line at a time, skipping malformed lines.
+
+    Lines not containing every byte string in needles are skipped without
+    being decoded (see raw_filter_needles). start/stop restrict the scan to a
+    byte range, e.g. one day's span from build_date_index.
+    """
     if not os.path.exists(audit_log_path):
-        return entries
-    with open(audit_log_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                entry = json.loads(line)
-                entries.append(entry)
-            except Exception:
+        return
+    needles = tuple(needles)
+    # orjson parses the raw bytes directly, so no per-line str is decoded
+    with open(audit_log_path, "rb") as f:
+        for line in _iter_log_lines(f, start, stop):
+            if needles and not all(needle in line for needle in needles):
                 continue
-    return entries
+            entry = _parse_log_line(line)
+            if entry is not None:
+                yield entry
+
+def build_date_index(audit_log_path: str) -> Optional[Dict[str, List[int]]]:
+    """
+    Map each YYYY-MM-DD day to the [start, stop) byte span holding its entries.
+
+    The map is kept in a JSON sidecar (<audit_log_path>.idx) and extended
+    incrementally: only complete lines appended since the last call are
+    scanned, and the sidecar is rebuilt if the log shrank or was replaced
+    (see _log_fingerprint). Spans run from a
+    day's first line to the end of its last, so out-of-order lines are still
+    covered. Returns None if the log cannot be memory-mapped.
+    """
+    index_path = audit_log_path + ".idx"
+    size = os.path.getsize(audit_log_path) if os.path.exists(audit_log_path) else 0
+    fingerprint = _log_fingerprint(audit_log_path)
+    days: Dict[str, List[int]] = {}
+    indexed = 0
+    try:
+        with open(index_path, "rb") as f:
+            saved = _json_loads(f.read())
+        if saved.get("fingerprint") == fingerprint and saved.get("size", 0) <= size:
+            days, indexed = saved["days"], saved["size"]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+    if indexed == size:
+        return days
+
+    with open(audit_log_path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return None
+        with mm:
+            pos = indexed
+            while True:
+                end = mm.find(b"\n", pos, size)
+                if end == -1:
+                    # Leave a trailing partial line for the next call
+                    break
+                entry = _parse_log_line(mm[pos:end])
+                day = _utc_day(entry.get("timestamp")) if entry is not None else None
+                if day is not None:
+                    span = days.get(day)
+                    if span is None:
+                        days[day] = [pos, end + 1]
+                    else:
+                        span[1] = end + 1
+                pos = end + 1
+            indexed = pos
+
+    try:
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"size": indexed, "fingerprint": fingerprint, "days": days}, f)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # A read-only log directory just means no cached index next time
+        pass
+    return days
+
+def raw_filter_needles(action: Optional[str] = None, label: Optional[str] = None,
+                       email_id: Optional[str] = None) -> List[bytes]:
+    """
+    Byte strings a raw log line must contain to possibly match the filters.
+
+    Each needle is the JSON-encoded filter value, so it only narrows the
+    candidates; filter_entries still performs the exact field comparison.
+    Values whose encoding may vary between writers (non-ASCII or escaped
+    characters) are left out.
+    """
+    needles = []
+    for value in (email_id, action, label):
+        if not value or not value.isascii():
+            continue
+        encoded = json.dumps(value)
+        if encoded[1:-1] == value:
+            needles.append(encoded.encode("ascii"))
+    return needles
+
+def load_audit_log(audit_log_path: str) -> List[Dict[str, Any]]:
+    return list(iter_audit_log(audit_log_path))
 
 def filter_entries(
-    entries: List[Dict[str, Any]],
+    entries: Iterable[Dict[str, Any]],
     date: Optional[str] = None,
     action: Optional[str] = None,
     label: Optional[str] = None,
     email_id: Optional[str] = None,
     dry_run: Optional[bool] = None,
-) -> List[Dict[str, Any]]:
-    result = []
+) -> Iterator[Dict[str, Any]]:
+    """Lazily yield the entries matching all of the given filters."""
     date_dt = parse_date(date) if date else None
+    # The date window is a single UTC calendar day, so an entry matches exactly
+    # when its timestamp's UTC day equals the window's day; only timestamps
+    # carrying an explicit offset need parsing.
+    date_key = date_dt.strftime("%Y-%m-%d") if date_dt else None
+    # Equality filters, most selective first, so they can reject an entry
+    # before the date check runs.
+    field_filters = [
+        (key, value)
+        for key, value in (("email_id", email_id), ("action", action), ("label", label))
+        if value
+    ]
+    if dry_run is not None:
+        field_filters.append(("dry_run", dry_run))
+    yield from filter(_compile_entry_predicate(field_filters, date_key), entries)
+
+def _compile_entry_predicate(field_filters: List[Tuple[str, Any]], date_key: Optional[str]) -> Callable[[Any], bool]:
+    """Build a match test specialized for one filter set, so the per-entry
+    loop does no work for filters that were not given."""
+    keys = tuple(key for key, _ in field_filters)
+    values = tuple(value for _, value in field_filters)
+
+    if not keys:
+        match_fields = None
+    elif len(keys) == 1:
+        (key,), (value,) = keys, values
+        match_fields = lambda entry: entry.get(key) == value
+    else:
+        match_fields = lambda entry: tuple(map(entry.get, keys)) == values
+
+    if not date_key:
+        if match_fields is None:
+            return lambda entry: isinstance(entry, dict)
+        return lambda entry: isinstance(entry, dict) and match_fields(entry)
+
+    def match(entry) -> bool:
+        if not isinstance(entry, dict):
+            return False
+        if match_fields is not None and not match_fields(entry):
+            return False
+        return _utc_day(entry.get("timestamp")) == date_key
+
+    return match
+
+def open_audit_index(index_path: str) -> sqlite3.Connection:
+    """Open (creating if needed) the SQLite sidecar index for an audit log."""
+    index_dir = os.path.dirname(index_path)
+    if index_dir:
+        os.makedirs(index_dir, exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS entries (
+            day TEXT,
+            action TEXT,
+            label TEXT,
+            email_id TEXT,
+            dry_run INTEGER,
+            raw BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_entries_email_id ON entries(email_id);
+        CREATE INDEX IF NOT EXISTS ix_entries_day ON entries(day);
+        CREATE INDEX IF NOT EXISTS ix_entries_action ON entries(action);
+        CREATE TABLE IF NOT EXISTS index_state (
+            key TEXT PRIMARY KEY,
+            value
+        );
+    """)
+    # index_state.value holds both the byte offset and the log fingerprint;
+    # indexes created when it was declared INTEGER are rebuilt once
+    columns = {name: decl for _, name, decl, *_ in conn.execute("PRAGMA table_info(index_state)")}
+    if columns.get("value"):
+        with conn:
+            conn.execute("DROP TABLE index_state")
+            conn.execute("CREATE TABLE index_state (key TEXT PRIMARY KEY, value)")
+            conn.execute("DELETE FROM entries")
+    return conn
+
+def sync_audit_index(conn: sqlite3.Connection, audit_log_path: str) -> int:
+    """
+    Append audit log lines written since the last sync to the index.
+
+    Only complete (newline-terminated) lines after the stored byte offset are
+    parsed, streamed from the file and inserted INDEX_SYNC_CHUNK_ROWS at a
+    time, each chunk committed together with the offset it reached. If the
+    log shrank or was replaced (see _log_fingerprint), the index is rebuilt
+    from scratch. Returns the number of entries added.
+    """
+    state = dict(conn.execute("SELECT key, value FROM index_state"))
+    offset = state.get("offset", 0)
+    size = os.path.getsize(audit_log_path) if os.path.exists(audit_log_path) else 0
+    fingerprint = _log_fingerprint(audit_log_path)
+    if size < offset or state.get("fingerprint") != fingerprint:
+        with conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute(
+                "INSERT OR REPLACE INTO index_state (key, value) VALUES ('fingerprint', ?), ('offset', 0)",
+                (fingerprint,),
+            )
+        offset = 0
+    if size == offset:
+        return 0
+
+    added = 0
+    pos = offset
+    rows = []
+    with open(audit_log_path, "rb") as f:
+        for line in _iter_log_lines(f, offset, size):
+            line_end = pos + len(line) + 1
+            if line_end > size:
+                break  # Leave a trailing partial line for the next sync
+            pos = line_end
+            entry = _parse_log_line(line)
+            if entry is not None:
+                dry_run = entry.get("dry_run")
+                rows.append((
+                    _utc_day(entry.get("timestamp")),
+                    entry.get("action"),
+                    entry.get("label"),
+                    entry.get("email_id"),
+                    int(dry_run) if isinstance(dry_run, bool) else None,
+                    line,
+                ))
+            if len(rows) >= INDEX_SYNC_CHUNK_ROWS:
+                _insert_index_rows(conn, rows, pos)
+                added += len(rows)
+                rows = []
+    if pos > offset:
+        _insert_index_rows(conn, rows, pos)
+        added += len(rows)
+    return added
+
+def _insert_index_rows(conn: sqlite3.Connection, rows: List[Tuple[Any, ...]], offset: int):
+    """Insert index rows and record the log offset they reach, in one transaction."""
+    with conn:
+        conn.executemany(
+            "INSERT INTO entries (day, action, label, email_id, dry_run, raw) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO index_state (key, value) VALUES ('offset', ?)",
+            (offset,),
+        )
+
+def query_audit_index(
+    conn: sqlite3.Connection,
+    date: Optional[str] = None,
+    action: Optional[str] = None,
+    label: Optional[str] = None,
+    email_id: Optional[str] = None,
+    dry_run: Optional[bool] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield indexed entries matching the filters, in log order (see filter_entries)."""
+    clauses = []
+    params: List[Any] = []
+    for column, value in (("email_id", email_id), ("action", action), ("label", label)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if dry_run is not None:
+        clauses.append("dry_run = ?")
+        params.append(int(dry_run))
+    date_dt = parse_date(date) if date else None
+    if date_dt:
+        clauses.append("day = ?")
+        params.append(date_dt.strftime("%Y-%m-%d"))
+    sql = "SELECT raw FROM entries"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY rowid"
+    for (raw,) in conn.execute(sql, params):
+        yield _json_loads(raw)
+
+def print_entries(entries: Iterable[Dict[str, Any]]) -> int:
+    count = 0
+    # Accumulate serialized entries and write them out in ~64KB chunks
+    # rather than issuing one write per entry.
+    chunk: List[bytes] = []
+    chunk_size = 0
     for entry in entries:
+        data = _dumps_indented(entry)
+        chunk.append(data)
+        chunk_size += len(data)
+        count += 1
+        if chunk_size >= PRINT_CHUNK_BYTES:
+            _write_stdout_bytes(b"".join(chunk))
+            chunk.clear()
+            chunk_size = 0
+    if chunk:
+        _write_stdout_bytes(b"".join(chunk))
+    if not count:
+        print("No matching audit log entries found.")
+    return count
+
+# (audit_log_path, entry) records waiting for the writer thread
+_audit_queue: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue()
+_audit_writer: Optional[threading.Thread] = None
+_audit_writer_lock = threading.Lock()
+
+def _encode_audit_entry(entry: Dict[str, Any]) -> bytes:
+    if orjson is not None:
         try:
-            # Date filter
-            if date_dt:
-                ts = entry.get("timestamp")
-                if not ts:
-                    continue
-                try:
-                    entry_dt = datetime.strptime(ts[:10], "%Y-%m-%d")
-                except Exception:
-                    continue
-                if entry_dt < date_dt or entry_dt >= date_dt + timedelta(days=1):
-                    continue
-            # Action filter
-            if action and entry.get("action") != action:
-                continue
-            # Label filter
-            if label and entry.get("label") != label:
-                continue
-            # Email ID filter
-            if email_id and entry.get("email_id") != email_id:
-                continue
-            # Dry run filter
-            if dry_run is not None and entry.get("dry_run") != dry_run:
-                continue
-            result.append(entry)
-        except Exception:
-            continue
-    return result
+            return orjson.dumps(entry) + b"\n"
+        except TypeError:
+            # e.g. lone surrogates or integers wider than 64 bits; the stdlib
+            # encoder escapes or accepts them
+            pass
+    return (json.dumps(entry) + "\n").encode("ascii")
 
-def print_entries(entries: List[Dict[str, Any]]):
-    if not entries:
-        print("No matching audit log entries found.")
+def _write_audit_records(records: List[Tuple[str, Dict[str, Any]]]):
+    """Append records to their audit logs with one open and write per file."""
+    by_path: Dict[str, List[bytes]] = defaultdict(list)
+    for audit_log_path, entry in records:
+        try:
+            by_path[audit_log_path].append(_encode_audit_entry(entry))
+        except Exception as e:
+            # One unencodable record must not cost the rest of the batch
+            print(f"Warning: Failed to encode audit action: {e}")
+    for audit_log_path, lines in by_path.items():
+        try:
+            # Ensure log directory exists
+            os.makedirs(os.path.dirname(audit_log_path) or ".", exist_ok=True)
+            with open(audit_log_path, "ab") as f:
+                f.write(b"".join(lines))
+        except Exception as e:
+            # Don't let logging failures break the main operation
+            print(f"Warning: Failed to log audit action: {e}")
+
+def _audit_writer_loop():
+    while True:
+        records = [_audit_queue.get()]
+        deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL_SECONDS
+        while len(records) < AUDIT_FLUSH_MAX_RECORDS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                records.append(_audit_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_audit_records(records)
+        except Exception as e:
+            # The writer must outlive any bad batch, or later records are
+            # queued forever
+            print(f"Warning: Failed to log audit action: {e}")
+        finally:
+            for _ in records:
+                _audit_queue.task_done()
+
+def _ensure_audit_writer():
+    global _audit_writer
+    if _audit_writer is not None and _audit_writer.is_alive():
         return
-    for entry in entries:
-        print(json.dumps(entry, indent=2, ensure_ascii=False))
+    with _audit_writer_lock:
+        if _audit_writer is None:
+            atexit.register(flush_audit_log, AUDIT_EXIT_FLUSH_TIMEOUT_SECONDS)
+        if _audit_writer is None or not _audit_writer.is_alive():
+            thread = threading.Thread(target=_audit_writer_loop, name="audit-writer", daemon=True)
+            thread.start()
+            _audit_writer = thread
+
+def flush_audit_log(timeout: Optional[float] = None) -> bool:
+    """
+    Block until every queued audit record has been written to disk.
+
+    Gives up after timeout seconds (if given), or as soon as the writer thread
+    is not running. Returns True if the queue was fully written.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _audit_queue.all_tasks_done:
+        while _audit_queue.unfinished_tasks:
+            if _audit_writer is None or not _audit_writer.is_alive():
+                return False
+            wait = AUDIT_FLUSH_INTERVAL_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+            _audit_queue.all_tasks_done.wait(wait)
+    return True
 
 def _log_audit_action(action_type: str, email_id: str, label: str, reason: str, dry_run: bool = False):
-    """Internal function to log audit actions to the audit log file."""
+    """Internal function to queue an audit action for the audit log file.
+
+    Safe to call from several threads; records are written by a single
+    background writer (see flush_audit_log).
+    """
     try:
         settings = load_settings(SETTINGS_PATH)
         audit_log_path = settings.get("audit", {}).get("audit_log_path", "logs/audit.log")
         
-        # Ensure log directory exists
-        os.makedirs(os.path.dirname(audit_log_path), exist_ok=True)
-        
         audit_entry = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
             "action": action_type,
             "email_id": email_id,
             "label": label,
@@ -125,8 +638,8 @@ def _log_audit_action(action_type: str, email_id: str, label: str, reason: str,
             "dry_run": dry_run
         }
         
-        with open(audit_log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(audit_entry, ensure_ascii=False) + "\n")
+        _ensure_audit_writer()
+        _audit_queue.put((audit_log_path, audit_entry))
             
     except Exception as e:
         # Don't let logging failures break the main operation
@@ -136,117 +649,178 @@ def log_action(action_type: str, email_id: str, label: str, reason: str, dry_run
     """Public function for logging audit actions - used by other modules."""
     _log_audit_action(action_type, email_id, label, reason, dry_run)
 
-def restore_action(audit_entry: Dict[str, Any], gmail_manager: GmailEmailManager, logger):
+def _restore_label_changes(action_type: Optional[str], label: Optional[str]) -> Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+    """Return the (add_labels, remove_labels) that undo an action, or None if it cannot be undone."""
+    if action_type == "TRASH":
+        return ("INBOX",), ("TRASH",)
+    if action_type == "LABEL_AND_ARCHIVE" and label:
+        return ("INBOX",), (label,)
+    if action_type == "ARCHIVE":
+        return ("INBOX",), ()
+    if action_type == "LABEL" and label:
+        return (), (label,)
+    return None
+
+def dedupe_restore_entries(audit_entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop repeated (email_id, action, label) entries, keeping the first.
+
+    Retried runs log the same action more than once; restoring it again would
+    only spend Gmail quota on a no-op.
     """
-    Restores a Gmail action based on the audit entry.
-    Supports restoring TRASH, LABEL_AND_ARCHIVE, ARCHIVE, DELETE, and LABEL actions.
+    seen = set()
+    unique = []
+    for entry in audit_entries:
+        key = (entry.get("email_id"), entry.get("action"), entry.get("label"))
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(entry)
+    return unique
+
+def restore_actions(audit_entries: List[Dict[str, Any]], gmail_manager: "GmailEmailManager", logger,
+                    max_workers: int = 1) -> Dict[str, bool]:
     """
-    email_id = audit_entry.get("email_id")
-    action_type = audit_entry.get("action")
-    label = audit_entry.get("label")
-    timestamp = audit_entry.get("timestamp")
+    Restores many Gmail actions at once.
 
-    if not email_id:
-        logger.warning(f"Skipping restoration: 'email_id' not found in audit entry: {audit_entry}")
-        return False
+    Entries are grouped by the label change needed to undo them, existence is
+    checked with one batched messages.get per 100 emails, and each group is
+    restored with messages.batchModify instead of one modify call per email.
+    With max_workers > 1, the groups are restored concurrently.
+    Returns a mapping of email_id to restore success.
+    """
+    results: Dict[str, bool] = {}
+    groups: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Dict[str, Any]]] = defaultdict(list)
+    for entry in audit_entries:
+        email_id = entry.get("email_id")
+        action_type = entry.get("action")
+        if not email_id:
+            logger.warning(f"Skipping restoration: 'email_id' not found in audit entry: {entry}")
+            continue
+        changes = _restore_label_changes(action_type, entry.get("label"))
+        if changes is None:
+            if action_type == "DELETE":
+                reason = "cannot restore permanently deleted email"
+            elif action_type in ("LABEL", "LABEL_AND_ARCHIVE"):
+                reason = f"label not found for {action_type} restoration"
+            else:
+                reason = f"unsupported action type for restoration: {action_type}"
+            logger.warning(f"Skipping email {email_id}: {reason}")
+            print(f"⚠️  Skipping email {email_id}: {reason}.")
+            results[email_id] = False
+            continue
+        groups[changes].append(entry)
 
-    logger.info(f"Attempting to restore action for email_id={email_id}, action={action_type}, label={label}")
+    if not groups:
+        return results
 
-    try:
-        # Verify email still exists and is accessible
-        email_data = gmail_manager.get_email(email_id)
-        if not email_data:
-            logger.warning(f"Email {email_id} not found or inaccessible. Cannot restore.")
-            print(f"Warning: Email {email_id} not found or inaccessible. Cannot restore.")
-            return False
+    # Verify the emails still exist and are accessible
+    candidate_ids = list(dict.fromkeys(e["email_id"] for group in groups.values() for e in group))
+    existing = gmail_manager.batch_get_messages(candidate_ids, format="minimal")
 
-        success = False
-        
-        if action_type == "TRASH":
-            # Restore from trash by removing TRASH label and adding INBOX
-            success = gmail_manager.modify_labels(email_id, add_labels=['INBOX'], remove_labels=['TRASH'])
-            if success:
-                logger.info(f"Successfully restored email {email_id} from trash.")
-                print(f"✅ Restored email {email_id} from trash.")
+    jobs = []
+    for (add_labels, remove_labels), group in groups.items():
+        ids = []
+        for entry in group:
+            email_id = entry["email_id"]
+            if existing.get(email_id):
+                ids.append(email_id)
             else:
-                logger.error(f"Failed to restore email {email_id} from trash.")
-                print(f"❌ Failed to restore email {email_id} from trash.")
-                
-        elif action_type == "LABEL_AND_ARCHIVE":
-            if not label:
-                logger.warning(f"Skipping LABEL_AND_ARCHIVE restoration: 'label' not found in audit entry for email_id={email_id}")
-                print(f"⚠️  Skipping LABEL_AND_ARCHIVE restoration for {email_id}: label not found.")
-                return False
+                logger.warning(f"Email {email_id} not found or inaccessible. Cannot restore.")
+                print(f"Warning: Email {email_id} not found or inaccessible. Cannot restore.")
+                results[email_id] = False
+        if ids:
+            jobs.append((list(add_labels), list(remove_labels), ids, group))
 
-            # To restore, add INBOX label and remove the custom label
-            success = gmail_manager.modify_labels(email_id, add_labels=['INBOX'], remove_labels=[label])
-            if success:
-                logger.info(f"Successfully restored email {email_id} by adding INBOX and removing label '{label}'.")
-                print(f"✅ Restored email {email_id} by adding INBOX and removing label '{label}'.")
-            else:
-                logger.error(f"Failed to restore email {email_id} by modifying labels (add INBOX, remove '{label}').")
-                print(f"❌ Failed to restore email {email_id} by modifying labels (add INBOX, remove '{label}').")
-                
-        elif action_type == "ARCHIVE":
-            # Restore by adding INBOX label back
-            success = gmail_manager.modify_labels(email_id, add_labels=['INBOX'], remove_labels=[])
-            if success:
-                logger.info(f"Successfully restored email {email_id} from archive by adding INBOX.")
-                print(f"✅ Restored email {email_id} from archive.")
-            else:
-                logger.error(f"Failed to restore email {email_id} from archive.")
-                print(f"❌ Failed to restore email {email_id} from archive.")
-                
-        elif action_type == "LABEL":
-            if not label:
-                logger.warning(f"Skipping LABEL restoration: 'label' not found in audit entry for email_id={email_id}")
-                print(f"⚠️  Skipping LABEL restoration for {email_id}: label not found.")
-                return False
-                
-            # Remove the label that was added
-            success = gmail_manager.modify_labels(email_id, add_labels=[], remove_labels=[label])
+    def _report(group: List[Dict[str, Any]], outcome: Dict[str, bool]):
+        for entry in group:
+            email_id = entry["email_id"]
+            if email_id not in outcome:
+                continue
+            action_type = entry.get("action")
+            success = outcome[email_id]
+            results[email_id] = success
             if success:
-                logger.info(f"Successfully restored email {email_id} by removing label '{label}'.")
-                print(f"✅ Restored email {email_id} by removing label '{label}'.")
+                logger.info(f"Successfully restored {action_type} for email {email_id}.")
+                print(f"✅ Restored {action_type} for email {email_id}.")
+                _log_audit_action("RESTORE", email_id, f"RESTORED_{action_type}", f"Restored action {action_type} from {entry.get('timestamp')}")
             else:
-                logger.error(f"Failed to restore email {email_id} by removing label '{label}'.")
-                print(f"❌ Failed to restore email {email_id} by removing label '{label}'.")
-                
-        elif action_type == "DELETE":
-            logger.warning(f"Cannot restore permanently deleted email {email_id}.")
-            print(f"⚠️  Cannot restore permanently deleted email {email_id}.")
-            return False
-            
-        else:
-            logger.warning(f"Unsupported action type for restoration: {action_type} for email_id={email_id}")
-            print(f"⚠️  Unsupported action type for restoration: {action_type} for email_id={email_id}")
-            return False
-            
-        # Log the restoration action
-        if success:
-            _log_audit_action("RESTORE", email_id, f"RESTORED_{action_type}", f"Restored action {action_type} from {timestamp}")
-            
-        return success
-        
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during restoration for email_id={email_id}: {e}")
-        print(f"❌ An unexpected error occurred during restoration for email_id={email_id}: {e}")
-        return False
+                logger.error(f"Failed to restore {action_type} for email {email_id}.")
+                print(f"❌ Failed to restore {action_type} for email {email_id}.")
+
+    if max_workers <= 1 or len(jobs) <= 1:
+        for add_labels, remove_labels, ids, group in jobs:
+            _report(group, gmail_manager.batch_modify_labels(ids, add_labels=add_labels, remove_labels=remove_labels))
+        return results
+
+    # Each label-change group is an independent, network-bound batchModify
+    # call. The API client is not thread-safe, so every worker thread gets
+    # its own authenticated manager; reporting stays on this thread.
+    from gmail_api_utils import GmailEmailManager, get_gmail_service
+
+    local = threading.local()
+
+    def _modify(add_labels: List[str], remove_labels: List[str], ids: List[str]) -> Dict[str, bool]:
+        if not hasattr(local, "manager"):
+            # Workers share the caller's quota limiter
+            local.manager = GmailEmailManager(get_gmail_service(), rate_limiter=gmail_manager.rate_limiter)
+        return local.manager.batch_modify_labels(ids, add_labels=add_labels, remove_labels=remove_labels)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        futures = {
+            executor.submit(_modify, add_labels, remove_labels, ids): (ids, group)
+            for add_labels, remove_labels, ids, group in jobs
+        }
+        for future in as_completed(futures):
+            ids, group = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                logger.error(f"Batch restore failed for {len(ids)} emails: {e}")
+                outcome = {email_id: False for email_id in ids}
+            _report(group, outcome)
 
-def export_stats(entries: List[Dict[str, Any]], fmt: str):
+    return results
+
+def export_stats(entries: Iterable[Dict[str, Any]], fmt: str) -> int:
+    """Write entries to stdout as CSV or a JSON array; returns the entry count."""
     if fmt == "csv":
         import csv
-        import io
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=entries[0].keys() if entries else [])
-        writer.writeheader()
+        # The header needs every column up front, so CSV has to see all rows
+        entries = entries if isinstance(entries, list) else list(entries)
+        # Standard audit fields first, then any extra keys in first-seen order,
+        # so fields missing from the first entry are not dropped.
+        columns = list(AUDIT_LOG_FIELDS)
+        known = set(columns)
         for entry in entries:
-            writer.writerow(entry)
-        print(output.getvalue())
-    else:
-        print(json.dumps(entries, indent=2, ensure_ascii=False))
+            for key in entry:
+                if key not in known:
+                    known.add(key)
+                    columns.append(key)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows([entry.get(column, "") for column in columns] for entry in entries)
+        return len(entries)
 
-def main():
+    # Stream the JSON array one element at a time, re-indenting each element
+    # one level so the output matches dumping the whole list at once. JSON
+    # strings never contain raw newlines, so the replace is safe.
+    count = 0
+    chunk: List[bytes] = []
+    chunk_size = 0
+    for entry in entries:
+        data = _dumps_indented(entry).rstrip(b"\n").replace(b"\n", b"\n  ")
+        chunk.append((b"[\n  " if not count else b",\n  ") + data)
+        chunk_size += len(data)
+        count += 1
+        if chunk_size >= PRINT_CHUNK_BYTES:
+            _write_stdout_bytes(b"".join(chunk))
+            chunk.clear()
+            chunk_size = 0
+    chunk.append(b"\n]\n" if count else b"[]\n")
+    _write_stdout_bytes(b"".join(chunk))
+    return count
+
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Audit and restore Gmail automation actions.")
     parser.add_argument("--date", type=str, help="Filter by date (YYYY-MM-DD, 'today', 'yesterday')")
     parser.add_argument("--action", type=str, help="Filter by action type (e.g., LABEL_AND_ARCHIVE, TRASH)")
@@ -256,42 +830,68 @@ def main():
     parser.add_argument("--restore", action="store_true", help="Restore/revert the specified action(s)")
     parser.add_argument("--stats", action="store_true", help="Export stats for filtered actions")
     parser.add_argument("--format", type=str, default="json", choices=["json", "csv"], help="Export format for stats (json/csv)")
-    args = parser.parse_args()
+    parser.add_argument("--index", action="store_true", help="Filter via an incrementally updated SQLite index of the audit log")
+    return parser
+
+_PARSER = _build_parser()
+
+def main():
+    args = _PARSER.parse_args()
 
     # Load settings
     settings = load_settings(SETTINGS_PATH)
     audit_log_path = settings.get("audit", {}).get("audit_log_path", "logs/audit.log")
+    audit_index_path = settings.get("audit", {}).get("audit_index_path", audit_log_path + ".sqlite")
     log_dir = settings.get("paths", {}).get("logs", "logs")
     log_config.init_logging(log_level=None, log_dir=log_dir, log_file_name="audit_tool.log")
     logger = log_config.get_logger("audit_tool")
 
     logger.info("Starting audit_tool.py")
-    logger.debug(f"Loaded settings: {settings}")
+    logger.debug("Loaded settings: %s", settings)
 
-    # Load audit log
-    try:
-        entries = load_audit_log(audit_log_path)
-        logger.info(f"Loaded {len(entries)} audit log entries from {audit_log_path}")
-    except Exception as e:
-        logger.error(f"Failed to load audit log: {e}")
-        print(f"Error: Failed to load audit log: {e}")
-        sys.exit(1)
-
-    # Filter entries
-    filtered = filter_entries(
-        entries,
+    # Parse and filter the audit log in a single streaming pass (or via the
+    # SQLite index with --index)
+    filters = dict(
         date=args.date,
         action=args.action,
         label=args.label,
         email_id=args.email_id,
         dry_run=args.dry_run if args.dry_run else None,
     )
-    logger.info(f"Filtered to {len(filtered)} entries with filters: date={args.date}, action={args.action}, label={args.label}, email_id={args.email_id}, dry_run={args.dry_run}")
+    try:
+        if args.index:
+            index_conn = open_audit_index(audit_index_path)
+            added = sync_audit_index(index_conn, audit_log_path)
+            logger.info(f"Indexed {added} new audit log entries into {audit_index_path}")
+            filtered = query_audit_index(index_conn, **filters)
+        else:
+            needles = raw_filter_needles(args.action, args.label, args.email_id)
+            start, stop = 0, None
+            date_dt = parse_date(args.date) if args.date else None
+            if date_dt:
+                # Only scan the byte span holding that day's entries
+                days = build_date_index(audit_log_path)
+                if days is not None:
+                    start, stop = days.get(date_dt.strftime("%Y-%m-%d"), (0, 0))
+            filtered = filter_entries(iter_audit_log(audit_log_path, needles, start, stop), **filters)
+        # Restore needs the full match set; printing and stats stream.
+        if args.restore:
+            filtered = list(filtered)
+            logger.info(f"Filtered to {len(filtered)} entries from {audit_log_path} with filters: {filters}")
+    except Exception as e:
+        logger.error(f"Failed to load audit log: {e}")
+        print(f"Error: Failed to load audit log: {e}")
+        sys.exit(1)
 
     # Stats export
     if args.stats:
-        export_stats(filtered, args.format)
-        logger.info(f"Exported stats in format: {args.format}")
+        try:
+            count = export_stats(filtered, args.format)
+        except Exception as e:
+            logger.error(f"Failed to load audit log: {e}")
+            print(f"Error: Failed to load audit log: {e}")
+            sys.exit(1)
+        logger.info(f"Exported {count} entries in format: {args.format}")
         return
 
     # Restore/revert actions
@@ -300,30 +900,43 @@ def main():
             print("No matching entries to restore.")
             logger.warning("No matching entries to restore.")
             return
+        unique = dedupe_restore_entries(filtered)
+        if len(unique) < len(filtered):
+            logger.info(f"Skipping {len(filtered) - len(unique)} duplicate audit entries.")
+        filtered = unique
         # Initialize Gmail API service and manager
         try:
+            from gmail_api_utils import GmailEmailManager, QuotaTokenBucket, get_gmail_service
             gmail_service = get_gmail_service()
             if not gmail_service:
                 logger.error("Failed to get Gmail service. Cannot proceed with restoration.")
                 print("Error: Failed to get Gmail service. Cannot proceed with restoration.")
                 return
-            gmail_manager = GmailEmailManager(gmail_service)
+            gmail_manager = GmailEmailManager(gmail_service, rate_limiter=QuotaTokenBucket())
         except Exception as e:
             logger.error(f"Failed to initialize GmailEmailManager: {e}")
             print(f"Error: Failed to initialize GmailEmailManager: {e}")
             return
 
-        for entry in filtered:
-            try:
-                restore_action(entry, gmail_manager, logger)
-            except Exception as e:
-                logger.error(f"Failed to restore action for email_id={entry.get('email_id')}: {e}")
-                print(f"Error: Failed to restore action for email_id={entry.get('email_id')}: {e}")
+        try:
+            results = restore_actions(filtered, gmail_manager, logger, max_workers=RESTORE_MAX_WORKERS)
+        except Exception as e:
+            logger.error(f"Failed to restore actions: {e}")
+            print(f"Error: Failed to restore actions: {e}")
+            return
+        restored = sum(1 for ok in results.values() if ok)
+        logger.info(f"Restored {restored}/{len(results)} emails.")
+        print(f"Restored {restored}/{len(results)} emails.")
         return
 
     # Default: print filtered entries
-    print_entries(filtered)
-    logger.info("Printed filtered entries.")
+    try:
+        count = print_entries(filtered)
+    except Exception as e:
+        logger.error(f"Failed to load audit log: {e}")
+        print(f"Error: Failed to load audit log: {e}")
+        sys.exit(1)
+    logger.info(f"Printed {count} filtered entries from {audit_log_path} with filters: {filters}")
 
     # TODO: Add GUI integration (see settings['user_interface']['enable_gui'])
     # TODO: Add advanced restoration logic (batch, confirmation, etc.)
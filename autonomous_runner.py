@@ -2,15 +2,38 @@ import os
 import sys
 import json
 import time
+import queue
+import random
+import signal
 import subprocess
-import traceback
-from datetime import datetime, timedelta
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson  # Optional: faster settings.json parsing and writing
+except ImportError:
+    orjson = None
+
+try:
+    from google.cloud import pubsub_v1  # Optional: Gmail push notifications
+except ImportError:
+    pubsub_v1 = None
+
+from googleapiclient.errors import HttpError
 
 from log_config import init_logging, get_logger
 from pid_utils import PIDFileManager
 from gmail_lm_cleaner import GmailLMCleaner
 from gmail_api_utils import GmailEmailManager, get_gmail_service
+from lm_studio_integration import analyze_email_subjects_with_lm_studio, update_config_from_lm_analysis
 import audit_tool
+import gemini_config_updater
 from cron_utils import CronScheduler # Import CronScheduler
 import email_cleanup
 from exceptions import (
@@ -20,12 +43,90 @@ from exceptions import (
 
 SETTINGS_PATH = "config/settings.json"
 DEFAULT_LOG_FILE = "automation.log"
+# Gmail history ID up to which the inbox has been fully processed
+SYNC_STATE_FILE = os.path.join("data", "gmail_sync_state.json")
+
+logger = get_logger(__name__)
+
+# gemini_config_updater.py is killed if it runs longer than this; the last
+# few stderr lines are kept for the failure message
+GEMINI_UPDATER_TIMEOUT_SECONDS = 600
+SUBPROCESS_STDERR_TAIL_LINES = 20
+
+# Gmail API statuses worth retrying (rate limiting and server errors)
+RETRYABLE_HTTP_STATUSES = (429, 500, 502, 503, 504)
+
+# Upper bound on the auto-sized number of concurrent LM Studio requests while
+# processing a batch of new emails (settings["realtime_workers"] overrides
+# it), and how many email bodies are fetched per batched Gmail request there
+LLM_ANALYSIS_MAX_WORKERS = 8
+REALTIME_FETCH_BATCH_SIZE = 10
+# Mini-batches of email bodies the prefetch thread may fetch ahead
+REALTIME_PREFETCH_DEPTH = 2
+
+# Bounds on how long the main loop sleeps while waiting for the next due job
+MIN_SCHEDULER_SLEEP_SECONDS = 1
+MAX_SCHEDULER_SLEEP_SECONDS = 300
+
+# LM Studio reachability probes (check_job_prerequisites) share one
+# keep-alive session, and a probe result is reused for this long
+LM_STUDIO_PROBE_CACHE_SECONDS = 10
+_health_session = requests.Session()
+_health_session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0))
+_health_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0))
+# url -> (time.monotonic() of the probe, (status_code, error))
+_lm_studio_probe_cache = {}
+
+# Set by SIGTERM/SIGINT; every wait in the main loop wakes on it so the runner
+# stops promptly instead of finishing a multi-minute sleep
+_shutdown_event = threading.Event()
+
+# Gmail push watches expire after 7 days; Google recommends renewing daily
+GMAIL_WATCH_RENEW_SECONDS = 24 * 60 * 60
+
+# Set by a Gmail push notification (from the Pub/Sub subscriber thread) or by
+# shutdown, to wake the main loop before the next scheduled job
+_wake_event = threading.Event()
+# Set by a Gmail push notification until realtime processing picks it up
+_gmail_push_pending = threading.Event()
+
+# settings_path -> (st_mtime_ns, st_size, parsed settings)
+_settings_cache = {}
+
+# Directories already created (or found) by _ensure_dir in this process
+_ensured_dirs = set()
+_ensured_dirs_lock = threading.Lock()
+
+def _ensure_dir(path):
+    """os.makedirs(path, exist_ok=True), but only the first time per path."""
+    if path in _ensured_dirs:
+        return
+    with _ensured_dirs_lock:
+        if path not in _ensured_dirs:
+            os.makedirs(path, exist_ok=True)
+            _ensured_dirs.add(path)
 
 def load_settings(settings_path):
-    """Loads settings from a JSON file."""
+    """
+    Loads settings from a JSON file.
+
+    The parsed settings are cached per path and only re-read when the file's
+    mtime or size changes. The returned dict is shared between callers and
+    must not be mutated.
+    """
     try:
-        with open(settings_path, "r") as f:
-            return json.load(f)
+        st = os.stat(settings_path)
+        cached = _settings_cache.get(settings_path)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        if orjson is not None:
+            with open(settings_path, "rb") as f:
+                settings = orjson.loads(f.read())
+        else:
+            with open(settings_path, "r") as f:
+                settings = json.load(f)
+        _settings_cache[settings_path] = (st.st_mtime_ns, st.st_size, settings)
+        return settings
     except FileNotFoundError:
         raise FileNotFoundError(f"Settings file not found at {settings_path}")
     except json.JSONDecodeError:
@@ -34,36 +135,87 @@ def load_settings(settings_path):
         raise RuntimeError(f"An unexpected error occurred while loading settings: {e}")
 
 def save_settings(settings, settings_path):
-    with open(settings_path, "w") as f:
-        json.dump(settings, f, indent=2, sort_keys=False)
+    # Serialize before touching the file and swap the new file in whole, so
+    # a value the encoder rejects can never leave settings.json empty
+    data = None
+    if orjson is not None:
+        try:
+            data = orjson.dumps(settings, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            # e.g. non-str keys or integers wider than 64 bits, which the
+            # stdlib encoder coerces or accepts
+            pass
+    if data is None:
+        data = json.dumps(settings, indent=2, sort_keys=False).encode("utf-8")
+    tmp_path = settings_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, settings_path)
 
 # Removed get_next_batch_time as it's replaced by CronScheduler
 
-def _retry_wrapper(func, max_retries=3, delay_seconds=5, *args, **kwargs):
-    logger = get_logger(__name__)
+def _utc_timestamp():
+    """Current UTC time as YYYYmmdd_HHMMSS, for output file names."""
+    # Integer formatting of gmtime() avoids strftime's locale handling
+    t = time.gmtime()
+    return f"{t.tm_year:04d}{t.tm_mon:02d}{t.tm_mday:02d}_{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}"
+
+def _realtime_worker_count(settings):
+    """Size the realtime LLM worker pool from settings or the usable CPU count."""
+    configured = settings.get("realtime_workers")
+    if isinstance(configured, int) and not isinstance(configured, bool) and configured > 0:
+        return configured
+    try:
+        n_cpu = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS/Windows
+        n_cpu = os.cpu_count() or 1
+    # The work is I/O-bound, but every worker is a request queued on the
+    # local LM Studio server, so the ceiling stays small
+    return min(LLM_ANALYSIS_MAX_WORKERS, 4 * n_cpu)
+
+def _is_retryable(error):
+    """Transient failures are retried; auth and other client (4xx) errors are not."""
+    if isinstance(error, AuthenticationError):
+        return False
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_HTTP_STATUSES
+    return True
+
+def _retry_wrapper(func, max_retries=5, base_delay=1.0, max_delay=60.0, *args, **kwargs):
+    """
+    Call func, retrying transient failures with capped exponential backoff.
+
+    The n-th retry waits base_delay * 2**(n-1) seconds scaled by a random
+    factor in [0.5, 1.5), capped at max_delay, so concurrent callers hitting a
+    Gmail 429 do not retry in lockstep. Non-retryable errors are raised
+    immediately.
+    """
     for attempt in range(1, max_retries + 1):
         try:
             return func(*args, **kwargs)
         except Exception as e:
             logger.warning(f"Attempt {attempt}/{max_retries} failed for {func.__name__}: {e}")
+            if not _is_retryable(e):
+                logger.error(f"Non-retryable error in {func.__name__}, not retrying.")
+                raise
             if attempt < max_retries:
-                logger.info(f"Retrying {func.__name__} in {delay_seconds} seconds...")
-                time.sleep(delay_seconds)
+                delay_seconds = min(max_delay, base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                logger.info(f"Retrying {func.__name__} in {delay_seconds:.1f} seconds...")
+                # Event.wait times out on the monotonic clock and returns
+                # early on shutdown
+                if _shutdown_event.wait(delay_seconds):
+                    raise
             else:
                 logger.error(f"All {max_retries} attempts failed for {func.__name__}.")
                 raise # Re-raise the last exception
 
 def run_batch_analysis(gmail_cleaner, export_dir, settings_path):
-    logger = get_logger(__name__)
     logger.info("Triggering batch analysis (LM Studio).")
     if not gmail_cleaner:
         logger.warning("GmailLMCleaner not initialized. Skipping batch analysis.")
         return False
 
     def _batch_analysis_task():
-        # Import LM Studio functions
-        from lm_studio_integration import analyze_email_subjects_with_lm_studio, update_config_from_lm_analysis
-        
         # Run LM Studio analysis using existing exported data or fresh export
         logger.info("Running LM Studio analysis on email subjects...")
         analysis_result = analyze_email_subjects_with_lm_studio(use_existing_export=True)
@@ -88,35 +240,35 @@ def run_batch_analysis(gmail_cleaner, export_dir, settings_path):
         return _retry_wrapper(_batch_analysis_task)
     except Exception as e:
         logger.error(f"Batch analysis failed after retries: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return False
 
-def run_realtime_processing(gmail_cleaner, email_manager, batch_size=50):
-    logger = get_logger(__name__)
+def run_realtime_processing(gmail_cleaner, email_manager, batch_size=50, prefetch_manager=None,
+                            max_workers=LLM_ANALYSIS_MAX_WORKERS, executor=None):
     logger.info("Triggering real-time email processing.")
 
     def _realtime_processing_task():
-        process_new_emails_batch(gmail_cleaner, email_manager, batch_size)
+        process_new_emails_batch(gmail_cleaner, email_manager, batch_size, prefetch_manager=prefetch_manager,
+                                 max_workers=max_workers, executor=executor)
         return True
 
     try:
         return _retry_wrapper(_realtime_processing_task)
     except Exception as e:
         logger.error(f"Real-time processing failed after retries: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return False
 
 def export_emails_for_analysis(export_dir, gmail_cleaner):
     """Export email subjects for batch analysis with Gemini."""
-    logger = get_logger(__name__)
-    export_filename = f"analysis_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.txt"
+    export_filename = f"analysis_{_utc_timestamp()}.txt"
     export_path = os.path.join(export_dir, export_filename)
     
     logger.info(f"Exporting email subjects to {export_path} for batch analysis.")
     
     try:
         # Ensure the export directory exists
-        os.makedirs(export_dir, exist_ok=True)
+        _ensure_dir(export_dir)
         
         # Call the export_subjects method from GmailLMCleaner
         exported_file_path = gmail_cleaner.export_subjects(
@@ -132,36 +284,40 @@ def export_emails_for_analysis(export_dir, gmail_cleaner):
             return None
     except IOError as e:
         logger.error(f"File I/O error during email export to {export_path}: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return None
     except Exception as e:
         logger.error(f"An unexpected error occurred during email export: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return None
 
-def run_gemini_analysis_on_export(export_path, output_dir):
-    """Run Gemini analysis on exported email subjects."""
-    logger = get_logger(__name__)
-    gemini_output_filename = f"gemini_output_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+def run_gemini_analysis_on_export(export_path, output_dir, gmail_cleaner):
+    """Run Gemini analysis on exported email subjects using the runner's GmailLMCleaner."""
+    gemini_output_filename = f"gemini_output_{_utc_timestamp()}.json"
     gemini_output_path = os.path.join(output_dir, gemini_output_filename)
 
     logger.info(f"Running Gemini analysis on exported subjects from {export_path}.")
 
+    if not gmail_cleaner:
+        logger.warning("GmailLMCleaner not initialized. Skipping Gemini analysis.")
+        return None
+
     try:
-        # Initialize GmailLMCleaner to access analyze_with_gemini
-        # Note: This will attempt to load settings and set up Gmail service,
-        # but for analysis, only the analyze_with_gemini method is strictly needed.
-        # Ensure GEMINI_API_KEY is set in .env for this to work.
-        gmail_cleaner = GmailLMCleaner()
-        
         # Perform Gemini analysis
+        # Ensure GEMINI_API_KEY is set in .env for this to work.
         gemini_rules = gmail_cleaner.analyze_with_gemini(subjects_file=export_path)
 
         if gemini_rules:
             # Save the resulting JSON rules to a file
-            os.makedirs(output_dir, exist_ok=True)
-            with open(gemini_output_path, "w") as f:
-                json.dump(gemini_rules, f, indent=2)
+            _ensure_dir(output_dir)
+            if orjson is not None:
+                # Serialized in one call, far faster than json.dump's
+                # incremental encoder for large rule sets
+                with open(gemini_output_path, "wb") as f:
+                    f.write(orjson.dumps(gemini_rules, option=orjson.OPT_INDENT_2))
+            else:
+                with open(gemini_output_path, "w") as f:
+                    json.dump(gemini_rules, f, indent=2)
             logger.info(f"Gemini analysis results saved to {gemini_output_path}.")
             return gemini_output_path
         else:
@@ -169,23 +325,98 @@ def run_gemini_analysis_on_export(export_path, output_dir):
             return None
     except (IOError, OSError) as e:
         logger.error(f"File I/O error during Gemini analysis or saving results: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return None
     except json.JSONDecodeError as e:
         logger.error(f"JSON decoding error during Gemini analysis (possibly malformed LLM output): {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return None
-    except ValueError as e: # Catch issues related to missing API keys or invalid config during GmailLMCleaner init
-        logger.error(f"Configuration error during Gemini analysis setup: {e}")
-        logger.debug(traceback.format_exc())
+    except ValueError as e: # Catch issues related to a missing or invalid Gemini API key
+        logger.error(f"Configuration error during Gemini analysis: {e}")
+        logger.debug("Traceback:", exc_info=True)
         return None
     except Exception as e:
         logger.error(f"An unexpected error occurred during Gemini analysis: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return None
 
+def _stream_subprocess(cmd, timeout=None):
+    """
+    Run a command, logging its stdout (INFO) and stderr (ERROR) line by line
+    as it is produced instead of buffering all output in memory.
+
+    Returns:
+        tuple: (returncode, stderr_tail) where stderr_tail holds the last
+        SUBPROCESS_STDERR_TAIL_LINES lines of stderr for error reporting.
+
+    Raises:
+        subprocess.TimeoutExpired: If the command runs longer than timeout
+            seconds (the process is killed first).
+    """
+    name = os.path.basename(cmd[1]) if len(cmd) > 1 else cmd[0]
+    stderr_tail = deque(maxlen=SUBPROCESS_STDERR_TAIL_LINES)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+
+    def _drain_stderr():
+        for line in proc.stderr:
+            line = line.rstrip()
+            stderr_tail.append(line)
+            logger.error("[%s] %s", name, line)
+
+    # Drain stderr on its own thread so a full stderr pipe can never block
+    # the child while we are reading stdout.
+    stderr_thread = threading.Thread(target=_drain_stderr, daemon=True)
+    stderr_thread.start()
+    timed_out = threading.Event()
+
+    def _kill_on_timeout():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, _kill_on_timeout) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        for line in proc.stdout:
+            logger.info("[%s] %s", name, line.rstrip())
+        returncode = proc.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        stderr_thread.join()
+        proc.stdout.close()
+        proc.stderr.close()
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return returncode, "\n".join(stderr_tail)
+
 def run_gemini_config_updater(gemini_output_path, settings_path):
-    logger = get_logger(__name__)
+    """
+    Apply Gemini output to the config. Runs gemini_config_updater in-process
+    unless settings["use_subprocess_updater"] asks for the old subprocess path.
+    """
+    try:
+        use_subprocess = load_settings(settings_path).get("use_subprocess_updater", False)
+    except Exception:
+        use_subprocess = False
+    if use_subprocess:
+        _run_gemini_config_updater_subprocess(gemini_output_path, settings_path)
+        return
+
+    try:
+        logger.info(f"Applying Gemini output {gemini_output_path} via gemini_config_updater")
+        gemini_config_updater.apply_gemini_output(gemini_output_path, settings_path, logger)
+    except FileNotFoundError as e:
+        logger.error(f"Gemini config update failed, file not found: {e}")
+        logger.debug("Traceback:", exc_info=True)
+    except ValueError as e:
+        logger.error(f"Gemini config update failed, invalid JSON: {e}")
+        logger.debug("Traceback:", exc_info=True)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while applying Gemini output: {e}")
+        logger.debug("Traceback:", exc_info=True)
+
+def _run_gemini_config_updater_subprocess(gemini_output_path, settings_path):
     try:
         cmd = [
             sys.executable, "gemini_config_updater.py",
@@ -194,22 +425,120 @@ def run_gemini_config_updater(gemini_output_path, settings_path):
         ]
         logger.info(f"Invoking gemini_config_updater.py with {gemini_output_path}")
         
-        # Using check=True to raise CalledProcessError for non-zero exit codes
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        returncode, stderr_tail = _stream_subprocess(cmd, timeout=GEMINI_UPDATER_TIMEOUT_SECONDS)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr_tail)
         logger.info("Gemini config update complete.")
     except FileNotFoundError:
         logger.error(f"Error: gemini_config_updater.py not found at {cmd[1]}. Ensure it's in the PATH or current directory.")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
+    except subprocess.TimeoutExpired as e:
+        logger.error(f"gemini_config_updater.py timed out after {e.timeout} seconds and was killed.")
+        logger.debug("Traceback:", exc_info=True)
     except subprocess.CalledProcessError as e:
         logger.error(f"gemini_config_updater.py failed with exit code {e.returncode}: {e.stderr}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
     except Exception as e:
         logger.error(f"An unexpected error occurred while running gemini_config_updater.py: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
+
+def _load_last_history_id():
+    try:
+        with open(SYNC_STATE_FILE, "r") as f:
+            return json.load(f).get("last_history_id")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to read sync state from {SYNC_STATE_FILE}: {e}")
+        return None
+
+def _save_last_history_id(history_id):
+    try:
+        _ensure_dir(os.path.dirname(SYNC_STATE_FILE))
+        with open(SYNC_STATE_FILE, "w") as f:
+            json.dump({"last_history_id": history_id}, f)
+    except Exception as e:
+        logger.warning(f"Failed to save sync state to {SYNC_STATE_FILE}: {e}")
+
+def _iter_prefetched_chunks(chunks, prefetch_manager, on_idle):
+    """
+    Yield (chunk, raw messages) pairs, fetching bodies ahead on a background thread.
+
+    prefetch_manager must wrap its own Gmail service, as it is used only from
+    the prefetch thread. on_idle is called while waiting for the next chunk.
+    """
+    prefetch_q = queue.Queue(maxsize=REALTIME_PREFETCH_DEPTH)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                prefetch_q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
 
-def process_new_emails_batch(gmail_cleaner, email_manager, batch_size=50):
-    """Process a batch of new emails with LLM analysis and action execution."""
-    logger = get_logger(__name__)
+    def _prefetch():
+        for chunk in chunks:
+            if stop.is_set():
+                return
+            msg_ids = [email_msg['id'] for email_msg in chunk]
+            try:
+                messages = prefetch_manager.batch_get_messages(msg_ids, format='full')
+            except Exception as e:
+                logger.warning(f"Prefetching {len(msg_ids)} email bodies failed: {e}")
+                messages = {}
+            _put((chunk, messages))
+        _put(None)
+
+    thread = threading.Thread(target=_prefetch, name="email-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = prefetch_q.get(timeout=0.1)
+            except queue.Empty:
+                if not thread.is_alive() and prefetch_q.empty():
+                    return
+                on_idle()
+                continue
+            if item is None:
+                return
+            yield item
+    finally:
+        stop.set()
+
+def _realtime_query(settings):
+    """
+    Gmail search query for realtime processing.
+
+    settings["llm_skip_senders"] (addresses or domains) are excluded
+    server-side so they are never fetched or sent to the LLM, and
+    settings["realtime_newer_than"] (e.g. "2d") bounds how far back unread
+    mail is picked up. Both are off by default.
+    """
+    terms = ["is:unread", "in:inbox"]
+    terms.extend(f"-from:{sender}" for sender in settings.get("llm_skip_senders", []) if sender)
+    newer_than = settings.get("realtime_newer_than")
+    if newer_than:
+        terms.append(f"newer_than:{newer_than}")
+    return " ".join(terms)
+
+def _is_fallback_decision(decision):
+    """True for the KEEP that analyze_email_with_llm returns when no LLM answer was obtained."""
+    reason = decision.get('reason', '')
+    return reason == "LLM service unavailable" or reason.startswith("Analysis error:")
+
+def process_new_emails_batch(gmail_cleaner, email_manager, batch_size=50, prefetch_manager=None,
+                             max_workers=LLM_ANALYSIS_MAX_WORKERS, executor=None):
+    """
+    Process a batch of new emails with LLM analysis and action execution.
+
+    With prefetch_manager (a GmailEmailManager on a second Gmail service),
+    email bodies are fetched on a background thread ahead of processing.
+    LLM analyses run on executor (a long-lived pool shared across batches)
+    or, without one, on a pool of max_workers threads created for this batch.
+    """
     logger.info(f"Processing new emails (batch_size={batch_size}).")
 
     if not gmail_cleaner or not email_manager:
@@ -217,75 +546,156 @@ def process_new_emails_batch(gmail_cleaner, email_manager, batch_size=50):
         return
 
     try:
+        # Skip the inbox search entirely when Gmail's history shows nothing
+        # was added to the inbox since the last fully processed listing
+        last_history_id = _load_last_history_id()
+        sync_history_id = None
+        if last_history_id:
+            changed, sync_history_id = email_manager.has_new_messages(last_history_id)
+            if not changed:
+                logger.info("No new emails since last sync.")
+                if sync_history_id:
+                    _save_last_history_id(sync_history_id)
+                return
+        # Taken before listing, so mail arriving meanwhile is seen next tick.
+        # history.list already reported the current ID; only ask for it when
+        # there was no usable history.
+        if not sync_history_id:
+            sync_history_id = email_manager.get_history_id()
+
         # Retrieve a batch of unprocessed emails from the inbox
         # Using 'UNREAD' to focus on new emails, and 'INBOX' to ensure they are in the primary inbox
-        emails = email_manager.list_emails(query="is:unread in:inbox", max_results=batch_size)
+        emails = email_manager.list_emails(query=_realtime_query(gmail_cleaner.settings), max_results=batch_size)
         
         if not emails:
             logger.info("No new emails to process.")
+            if sync_history_id:
+                _save_last_history_id(sync_history_id)
             return
 
         logger.info(f"Found {len(emails)} new emails to process.")
 
-        for i, email_msg in enumerate(emails, 1):
-            msg_id = email_msg['id']
+        # (msg_id, action, reason) decisions waiting to be applied to Gmail
+        decided = []
+        # Emails left unread because analysis or the action failed; while
+        # any remain, the history ID is not advanced so they are retried
+        failed_ids = []
+
+        def _record_decision(future, i, msg_id, email_data):
             logger.info(f"[{i}/{len(emails)}] Processing email ID: {msg_id}")
             
             try:
-                email_data = gmail_cleaner.get_email_content(msg_id)
-                if not email_data:
-                    logger.warning(f"Could not retrieve content for email ID: {msg_id}. Skipping.")
-                    audit_tool.log_action("WARNING", msg_id, "Skipped", "Could not retrieve email content")
-                    continue
-
                 logger.info(f"  Subject: {email_data['subject'][:70]}...")
                 logger.info(f"  From: {email_data['sender']}")
 
-                # Analyze email with local LLM
-                decision = gmail_cleaner.analyze_email_with_llm(email_data)
+                # Result of the local LLM analysis
+                decision = future.result()
                 action = decision.get('action', 'KEEP')
                 reason = decision.get('reason', 'No specific reason provided by LLM.')
                 
                 logger.info(f"  LLM Decision: Action='{action}', Reason='{reason}'")
-
-                # Execute the recommended action and log to audit
-                success = gmail_cleaner.execute_action(
-                    email_data['id'],
-                    action,
-                    reason,
-                    log_callback=audit_tool.log_action
-                )
-                if not success:
-                    logger.error(f"Failed to execute action '{action}' for email ID: {msg_id}")
-                    audit_tool.log_action("ERROR", msg_id, action, f"Failed to execute action: {reason}")
+                if _is_fallback_decision(decision):
+                    failed_ids.append(msg_id)
+                decided.append((email_data['id'], action, reason))
             except EmailProcessingError as processing_e:
+                failed_ids.append(msg_id)
                 processing_e.log_error(logger)
                 audit_tool.log_action("ERROR", msg_id, "Processing Failed", f"Processing error: {processing_e.message}")
-                continue  # Continue to next email on processing errors
             except LLMConnectionError as llm_e:
+                failed_ids.append(msg_id)
                 llm_e.log_error(logger)
                 audit_tool.log_action("ERROR", msg_id, "LLM Failed", f"LLM error: {llm_e.message}")
-                continue  # Continue to next email on LLM errors
-            except GmailAPIError as api_e:
-                api_e.log_error(logger)
-                audit_tool.log_action("ERROR", msg_id, "API Failed", f"API error: {api_e.message}")
-                continue  # Continue to next email on API errors
             except Exception as email_e:
+                failed_ids.append(msg_id)
                 logger.error(f"Unexpected error processing email ID {msg_id}: {email_e}")
-                logger.debug(traceback.format_exc())
+                logger.debug("Traceback:", exc_info=True)
                 audit_tool.log_action("ERROR", msg_id, "Unexpected Error", f"Error: {email_e}")
-                continue
+
+        def _execute_decided():
+            # Emails with the same action are moved with one batchModify call,
+            # and each applied change is logged to audit
+            if not decided:
+                return
+            batch = decided[:]
+            decided.clear()
+            try:
+                results = gmail_cleaner.execute_actions_batch(batch, audit_callback=audit_tool.log_action)
+            except GmailAPIError as api_e:
+                api_e.log_error(logger)
+                results = {}
+            except Exception as e:
+                logger.error(f"Unexpected error executing actions for {len(batch)} emails: {e}")
+                logger.debug("Traceback:", exc_info=True)
+                results = {}
+            for msg_id, action, reason in batch:
+                if not results.get(msg_id):
+                    failed_ids.append(msg_id)
+                    logger.error(f"Failed to execute action '{action}' for email ID: {msg_id}")
+                    audit_tool.log_action("ERROR", msg_id, action, f"Failed to execute action: {reason}")
+
+        # The batch is pipelined in mini-batches: bodies for the next
+        # mini-batch are fetched (one batched request) while the LLM analyses
+        # of earlier ones run on a small thread pool. Finished decisions are
+        # applied in groups of about a mini-batch rather than after the whole
+        # batch. Gmail actions and audit logging stay on this thread, since
+        # the API client is not thread-safe; with a prefetch_manager,
+        # fetching moves to a background thread on its own service.
+        with nullcontext(executor) if executor is not None else ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+
+            def _apply_finished():
+                for future in [f for f in pending if f.done()]:
+                    _record_decision(future, *pending.pop(future))
+                if len(decided) >= REALTIME_FETCH_BATCH_SIZE:
+                    _execute_decided()
+
+            chunks = [emails[start:start + REALTIME_FETCH_BATCH_SIZE]
+                      for start in range(0, len(emails), REALTIME_FETCH_BATCH_SIZE)]
+            if prefetch_manager is not None:
+                fetched = _iter_prefetched_chunks(chunks, prefetch_manager, on_idle=_apply_finished)
+            else:
+                fetched = ((chunk, None) for chunk in chunks)
+
+            position = 0
+            for chunk, messages in fetched:
+                email_contents = gmail_cleaner.get_email_contents_batch(
+                    [email_msg['id'] for email_msg in chunk], messages=messages
+                )
+                for i, email_msg in enumerate(chunk, position + 1):
+                    msg_id = email_msg['id']
+                    email_data = email_contents.get(msg_id)
+                    if not email_data:
+                        failed_ids.append(msg_id)
+                        logger.warning(f"Could not retrieve content for email ID: {msg_id}. Skipping.")
+                        audit_tool.log_action("WARNING", msg_id, "Skipped", "Could not retrieve email content")
+                        continue
+                    pending[executor.submit(gmail_cleaner.analyze_email_with_llm, email_data)] = (i, msg_id, email_data)
+                position += len(chunk)
+
+                # Act on analyses that finished while this mini-batch was fetched
+                _apply_finished()
+
+            for future in as_completed(pending):
+                _record_decision(future, *pending[future])
+        _execute_decided()
+
+        # A full batch may have left older unread mail behind, so only mark
+        # the inbox as synced once a listing came back short and every email
+        # in it was analyzed and acted on
+        if failed_ids:
+            logger.info(f"{len(failed_ids)} emails were not fully processed; they will be listed again next run.")
+        elif sync_history_id and len(emails) < batch_size:
+            _save_last_history_id(sync_history_id)
 
     except GmailAPIError as api_e:
         api_e.log_error(logger)
         logger.error("Gmail API error during batch retrieval - may need re-authentication")
     except Exception as e:
         logger.error(f"Unexpected error during real-time email processing: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
 
 def run_email_cleanup(gmail_service, settings_path):
     """Run email cleanup based on retention policies."""
-    logger = get_logger(__name__)
     logger.info("Starting scheduled email cleanup process.")
     
     try:
@@ -335,9 +745,28 @@ def run_email_cleanup(gmail_service, settings_path):
             
     except Exception as e:
         logger.error(f"Error during email cleanup: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return False
 
+def _probe_lm_studio(url):
+    """
+    GET url on the shared health-check session.
+
+    Returns:
+        tuple: (status_code, error); status_code is None when the request
+        failed with error. Results are cached for LM_STUDIO_PROBE_CACHE_SECONDS.
+    """
+    now = time.monotonic()
+    cached = _lm_studio_probe_cache.get(url)
+    if cached is not None and now - cached[0] < LM_STUDIO_PROBE_CACHE_SECONDS:
+        return cached[1]
+    try:
+        result = (_health_session.get(url, timeout=5).status_code, None)
+    except requests.exceptions.RequestException as e:
+        result = (None, e)
+    _lm_studio_probe_cache[url] = (now, result)
+    return result
+
 def check_job_prerequisites(job_name, settings, logger):
     """
     Check if prerequisites are met for a specific job.
@@ -353,13 +782,11 @@ def check_job_prerequisites(job_name, settings, logger):
     if job_name == "batch_analysis":
         # Check if LM Studio is reachable
         lm_studio_endpoint = settings.get("api", {}).get("lm_studio", {}).get("endpoint", "http://localhost:1234")
-        try:
-            import requests
-            response = requests.get(f"{lm_studio_endpoint}/v1/models", timeout=5)
-            if response.status_code != 200:
-                return False, f"LM Studio models endpoint check failed: {response.status_code}"
-        except requests.exceptions.RequestException as e:
-            return False, f"LM Studio not reachable for batch analysis: {e}"
+        status_code, error = _probe_lm_studio(f"{lm_studio_endpoint}/v1/models")
+        if error is not None:
+            return False, f"LM Studio not reachable for batch analysis: {error}"
+        if status_code != 200:
+            return False, f"LM Studio models endpoint check failed: {status_code}"
         
         # Check export directory exists
         export_dir = settings.get("paths", {}).get("exports", "exports")
@@ -373,13 +800,11 @@ def check_job_prerequisites(job_name, settings, logger):
     elif job_name == "realtime_processing":
         # Check if LM Studio is reachable
         lm_studio_endpoint = settings.get("api", {}).get("lm_studio", {}).get("endpoint", "http://localhost:1234")
-        try:
-            import requests
-            response = requests.get(f"{lm_studio_endpoint}/health", timeout=5)
-            if response.status_code != 200:
-                return False, f"LM Studio health check failed: {response.status_code}"
-        except requests.exceptions.RequestException as e:
-            return False, f"LM Studio not reachable: {e}"
+        status_code, error = _probe_lm_studio(f"{lm_studio_endpoint}/health")
+        if error is not None:
+            return False, f"LM Studio not reachable: {error}"
+        if status_code != 200:
+            return False, f"LM Studio health check failed: {status_code}"
     
     elif job_name == "email_cleanup":
         # Check if cleanup is enabled
@@ -412,7 +837,7 @@ def log_job_result_to_main_log(job_name, success, duration, details, logger):
     logger.info(f"Status: {status}")
     logger.info(f"Duration: {duration}")
     logger.info(f"Details: {details}")
-    logger.info(f"Timestamp: {datetime.utcnow().isoformat()}Z")
+    logger.info(f"Timestamp: {datetime.now(timezone.utc).isoformat()}")
     logger.info(f"=== END JOB SUMMARY ===")
 
 def main():
@@ -436,7 +861,6 @@ def main():
     log_dir = settings.get("paths", {}).get("logs", "logs")
     log_file = DEFAULT_LOG_FILE
     init_logging(log_dir=log_dir, log_file_name=log_file)
-    logger = get_logger(__name__)
     
     # Initialize PID file management
     try:
@@ -450,9 +874,67 @@ def main():
         logger.error(f"Unexpected error in autonomous runner: {e}")
         sys.exit(1)
 
+def _request_shutdown(signum, frame):
+    """Signal handler: ask the main loop to exit after the current job."""
+    logger.info(f"Received signal {signum}, shutting down gracefully...")
+    _shutdown_event.set()
+    _wake_event.set()
+
+def _on_gmail_push(message):
+    """Pub/Sub callback (subscriber thread): wake the main loop to process new mail."""
+    try:
+        notification = json.loads(message.data.decode("utf-8"))
+        logger.debug("Gmail push notification for history ID %s", notification.get("historyId"))
+    except Exception as e:
+        logger.debug("Undecodable Gmail push notification: %s", e)
+    message.ack()
+    _gmail_push_pending.set()
+    _wake_event.set()
+
+def _start_gmail_push(settings):
+    """
+    Subscribe to Gmail push notifications if settings["gmail_push"] names a
+    Pub/Sub topic and subscription (full resource paths).
+
+    Returns:
+        The subscriber's streaming pull future, or None when push is not
+        configured or unavailable (realtime processing then only polls).
+    """
+    push_settings = settings.get("gmail_push", {})
+    topic = push_settings.get("topic")
+    subscription = push_settings.get("subscription")
+    if not topic or not subscription:
+        return None
+    if pubsub_v1 is None:
+        logger.warning("gmail_push is configured but google-cloud-pubsub is not installed; polling only.")
+        return None
+    try:
+        subscriber = pubsub_v1.SubscriberClient()
+        future = subscriber.subscribe(subscription, callback=_on_gmail_push)
+    except Exception as e:
+        logger.warning(f"Could not subscribe to Gmail push notifications on {subscription}, polling only: {e}")
+        logger.debug("Traceback:", exc_info=True)
+        return None
+    logger.info(f"Listening for Gmail push notifications on {subscription}.")
+    return future
+
+def _renew_gmail_watch(email_manager, topic_name):
+    """Register the INBOX push watch; returns the time.time() at which to renew it."""
+    response = email_manager.watch_mailbox(topic_name, label_ids=['INBOX'])
+    if not response:
+        # Retry on a later loop iteration
+        return time.time() + MAX_SCHEDULER_SLEEP_SECONDS
+    logger.info(f"Gmail push watch on INBOX registered to {topic_name} (history ID {response.get('historyId')}).")
+    return time.time() + GMAIL_WATCH_RENEW_SECONDS
+
 def _run_main_loop(settings, logger):
     """Main loop logic extracted for PID file management."""
     
+    # Replace PIDFileManager's exit-on-signal handlers; the PID file is still
+    # removed when main() leaves the PIDFileManager context
+    signal.signal(signal.SIGTERM, _request_shutdown)
+    signal.signal(signal.SIGINT, _request_shutdown)
+
     # Initialize Gmail API service
     gmail_service = None
     try:
@@ -472,14 +954,14 @@ def _run_main_loop(settings, logger):
         return
     except Exception as e:
         logger.error(f"Unexpected error initializing Gmail API service: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return
 
     # Initialize GmailLMCleaner and GmailEmailManager
     gmail_cleaner = None
     email_manager = None
     try:
-        gmail_cleaner = GmailLMCleaner(service=gmail_service)
+        gmail_cleaner = GmailLMCleaner(service=gmail_service, settings=settings)
         email_manager = GmailEmailManager(service=gmail_service)
         logger.info("GmailLMCleaner and GmailEmailManager initialized successfully.")
     except ConfigurationError as config_e:
@@ -492,9 +974,22 @@ def _run_main_loop(settings, logger):
         return
     except Exception as e:
         logger.error(f"Unexpected error initializing GmailLMCleaner or GmailEmailManager: {e}")
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return
 
+    # A second Gmail service, used only by the realtime body-prefetch thread
+    prefetch_manager = None
+    try:
+        prefetch_manager = GmailEmailManager(service=get_gmail_service())
+    except Exception as e:
+        logger.warning(f"Could not create Gmail service for prefetching, fetching inline: {e}")
+
+    realtime_workers = _realtime_worker_count(settings)
+    logger.info(f"Realtime processing will run up to {realtime_workers} concurrent LLM analyses.")
+    # Kept for the runner's lifetime so worker threads (and their keep-alive
+    # LM Studio sessions) are reused by every realtime batch
+    llm_executor = ThreadPoolExecutor(max_workers=realtime_workers, thread_name_prefix="llm-analysis")
+
     # Scheduling config
     # Use reasonable cron expressions for the jobs
     jobs_config = {
@@ -509,14 +1004,30 @@ def _run_main_loop(settings, logger):
     scheduler = CronScheduler(jobs_config)
     logger.info("CronScheduler initialized with jobs: %s", ", ".join(jobs_config.keys()))
 
+    # Gmail push notifications (optional) run realtime processing as soon as
+    # mail arrives; the cron schedule stays as a fallback poll, which is cheap
+    # on an idle mailbox thanks to the history check
+    push_future = _start_gmail_push(settings)
+    push_topic = settings.get("gmail_push", {}).get("topic") if push_future else None
+    watch_renew_at = 0.0
+
     # Main loop
-    while True:
+    while not _shutdown_event.is_set():
         try:
+            if push_topic and time.time() >= watch_renew_at:
+                watch_renew_at = _renew_gmail_watch(email_manager, push_topic)
+
             due_jobs = scheduler.get_due_jobs()
+            if _gmail_push_pending.is_set():
+                _gmail_push_pending.clear()
+                if not any(job.name == "realtime_processing" for job in due_jobs):
+                    due_jobs.append(scheduler.jobs["realtime_processing"])
             if due_jobs:
                 logger.info(f"Found {len(due_jobs)} job(s) due: {[job.name for job in due_jobs]}")
             
             for job in due_jobs:
+                if _shutdown_event.is_set():
+                    break
                 logger.info(f"Checking prerequisites for job: {job.name}")
                 
                 # Check prerequisites before running job
@@ -536,7 +1047,10 @@ def _run_main_loop(settings, logger):
                         success = run_batch_analysis(gmail_cleaner, export_dir, SETTINGS_PATH)
                         job_details = f"Export dir: {export_dir}"
                     elif job.name == "realtime_processing":
-                        success = run_realtime_processing(gmail_cleaner, email_manager, batch_size=50)
+                        success = run_realtime_processing(gmail_cleaner, email_manager, batch_size=50,
+                                                          prefetch_manager=prefetch_manager,
+                                                          max_workers=realtime_workers,
+                                                          executor=llm_executor)
                         job_details = "Batch size: 50"
                     elif job.name == "email_cleanup":
                         success = run_email_cleanup(gmail_service, SETTINGS_PATH)
@@ -564,33 +1078,41 @@ def _run_main_loop(settings, logger):
                     auth_e.log_error(logger)
                     scheduler.update_job(job.name, status="error") 
                     logger.critical(f"Authentication failed for job '{job.name}'. System may need re-authentication.")
-                    time.sleep(300)  # Wait 5 minutes before retrying on auth errors
+                    _shutdown_event.wait(300)  # Wait 5 minutes before retrying on auth errors
                 except Exception as job_e:
                     logger.error(f"Unexpected error executing job '{job.name}': {job_e}")
-                    logger.debug(traceback.format_exc())
+                    logger.debug("Traceback:", exc_info=True)
                     scheduler.update_job(job.name, status="error")
 
-        except KeyboardInterrupt:
-            logger.info("Received interrupt signal, shutting down gracefully...")
-            break
         except (GmailAPIError, LLMConnectionError) as recoverable_e:
             recoverable_e.log_error(logger)
             logger.warning("Recoverable error in main loop, continuing after delay...")
-            time.sleep(30)  # Brief pause for recoverable errors
+            _shutdown_event.wait(30)  # Brief pause for recoverable errors
         except AuthenticationError as auth_e:
             auth_e.log_error(logger)
             logger.critical("Authentication error in main loop. Manual intervention required.")
-            time.sleep(3600)  # Wait 1 hour before retrying on auth errors
+            _shutdown_event.wait(3600)  # Wait 1 hour before retrying on auth errors
         except Exception as e:
             logger.critical(f"Critical unexpected error in main loop: {e}")
-            logger.debug(traceback.format_exc())
+            logger.debug("Traceback:", exc_info=True)
             # Sleep longer on critical error to prevent rapid-fire failures
-            time.sleep(60)
+            _shutdown_event.wait(60)
+
+        # Sleep until the next job is due instead of polling on a fixed tick.
+        # The upper bound re-checks periodically (e.g. after clock changes);
+        # the lower bound keeps a job that stays due from spinning the loop.
+        sleep_interval_seconds = min(
+            max(scheduler.seconds_until_next_due(), MIN_SCHEDULER_SLEEP_SECONDS),
+            MAX_SCHEDULER_SLEEP_SECONDS,
+        )
+        logger.debug("Sleeping for %.1f seconds until the next due job.", sleep_interval_seconds)
+        _wake_event.wait(sleep_interval_seconds)
+        _wake_event.clear()
 
-        # Sleep for a shorter, fixed interval to allow for more responsive scheduling checks
-        sleep_interval_seconds = 30
-        logger.debug(f"Sleeping for {sleep_interval_seconds} seconds.")
-        time.sleep(sleep_interval_seconds)
+    if push_future:
+        push_future.cancel()
+    llm_executor.shutdown(wait=False, cancel_futures=True)
+    logger.info("Autonomous runner stopped.")
 
 if __name__ == "__main__":
     """
@@ -598,6 +1120,8 @@ if __name__ == "__main__":
 
     - Periodically triggers batch analysis (Gemini) and real-time email processing (LM Studio).
     - Loads configuration from settings.json.
+    - Optionally runs real-time processing on Gmail push notifications
+      (settings["gmail_push"]: Pub/Sub "topic" and "subscription" paths).
     - Initializes logging using log_config.py.
     - Logs all major actions, errors, and scheduling events.
     - Provides robust error handling and clear TODOs for unimplemented integrations.
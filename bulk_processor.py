@@ -7,16 +7,22 @@ Enhanced with backlog analysis and optimized processing strategies
 
 import os
 import sys
+import gc
 import time
 import logging
 import argparse
 from datetime import datetime
 from gmail_lm_cleaner import GmailLMCleaner
+from gmail_api_utils import QuotaTokenBucket, GmailEmailManager, GmailLabelManager
 from log_config import init_logging
-from tools.filter_harvester import apply_existing_filters_to_backlog, fetch_and_parse_filters
+from tools.filter_harvester import apply_existing_filters_to_backlog, get_and_cache_filters
 from exceptions import GmailAPIError, EmailProcessingError, LLMConnectionError
 from pid_utils import PIDFileManager
 
+# Mailbox history ID as of the start of the last complete run; the next run's
+# LLM pass only looks at mail added to the inbox since then
+HISTORY_ID_FILE = "logs/.history_id"
+
 
 def run_server_side_filter_pass(cleaner, log_callback):
     """
@@ -27,7 +33,8 @@ def run_server_side_filter_pass(cleaner, log_callback):
     try:
         stats = apply_existing_filters_to_backlog(
             cleaner.service,
-            progress_callback=lambda msg, prog: log_callback(f"Filter Progress: {msg} ({prog:.0f}%)")
+            progress_callback=lambda msg, prog: log_callback(f"Filter Progress: {msg} ({prog:.0f}%)"),
+            rate_limiter=cleaner.rate_limiter
         )
         
         processed_count = stats.get('server_side_processed', 0)
@@ -35,12 +42,12 @@ def run_server_side_filter_pass(cleaner, log_callback):
         
         log_callback(f"✅ Server-side filtering complete. Processed {processed_count} emails across {len(filter_stats)} filters.")
         
+        # The filters were fetched and cached by the pass above
+        filter_map = {f['id']: f for f in get_and_cache_filters(cleaner.service)}
+        
         if filter_stats:
             log_callback("📊 Filter Application Stats:")
-            # Fetch filter details to show human-readable queries
-            all_filters = fetch_and_parse_filters(cleaner.service)
-            filter_map = {f['id']: f for f in all_filters}
-            
+            # Show human-readable queries
             for filter_id, count in filter_stats.items():
                 filter_details = filter_map.get(filter_id)
                 query_str = f"'{filter_details['query']}'" if filter_details else f"ID: {filter_id}"
@@ -48,13 +55,10 @@ def run_server_side_filter_pass(cleaner, log_callback):
 
         # Determine which labels were applied to exclude them in the next phase
         applied_labels = set()
-        all_filters = fetch_and_parse_filters(cleaner.service)
-        for filter_data in all_filters:
-            if filter_data['id'] in filter_stats:
-                # Add labels from the action to our set
-                if 'add_labels' in filter_data['action']:
-                    for label_name in filter_data['action']['add_labels']:
-                        applied_labels.add(label_name)
+        for filter_id in filter_stats:
+            filter_data = filter_map.get(filter_id)
+            if filter_data:
+                applied_labels.update(filter_data['action'].get('add_labels', []))
 
         return stats, list(applied_labels)
 
@@ -66,6 +70,27 @@ def run_server_side_filter_pass(cleaner, log_callback):
     return {"server_side_processed": 0, "filter_stats": {}}, []
 
 
+def _load_history_id():
+    try:
+        with open(HISTORY_ID_FILE, "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.getLogger("BulkProcessor").warning(f"Failed to read {HISTORY_ID_FILE}: {e}")
+        return None
+
+def _save_history_id(history_id):
+    try:
+        os.makedirs(os.path.dirname(HISTORY_ID_FILE), exist_ok=True)
+        tmp_path = HISTORY_ID_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(history_id)
+        os.replace(tmp_path, HISTORY_ID_FILE)  # Never leave a half-written ID
+    except Exception as e:
+        logging.getLogger("BulkProcessor").warning(f"Failed to save {HISTORY_ID_FILE}: {e}")
+
+
 def setup_logging():
     """Initialize logging for bulk processing."""
     log_dir = "logs"
@@ -79,8 +104,14 @@ def setup_logging():
     )
     return logging.getLogger("BulkProcessor")
 
+# The backlog reports progress after every email; printing each one costs a
+# blocking stdout write when output is piped to a log or status tool
+PROGRESS_PRINT_INTERVAL = 100
+
 def progress_callback(processed, total):
     """Progress callback for batch processing."""
+    if processed % PROGRESS_PRINT_INTERVAL and processed != total:
+        return
     if total > 0:
         percentage = (processed / total) * 100
         print(f"Progress: {processed}/{total} ({percentage:.1f}%)")
@@ -100,6 +131,10 @@ def main():
     parser = argparse.ArgumentParser(description="Bulk Email Processor with Server-Side Filtering")
     parser.add_argument("--batch-size", type=int, default=50,
                        help="Batch size for LLM processing (default: 50)")
+    parser.add_argument("--llm-workers", type=int, default=4,
+                       help="Concurrent LLM analyses per batch (default: 4)")
+    parser.add_argument("--full-scan", action="store_true",
+                       help="LLM-process the whole inbox instead of only mail added since the last run")
     
     args = parser.parse_args()
     
@@ -109,21 +144,24 @@ def main():
     print("🚀 Gmail Bulk Email Processor - Server-Side Filtering Edition")
     print("=" * 80)
     print(f"📦 LLM Batch size: {args.batch_size}")
+    print(f"🧵 Concurrent LLM analyses: {args.llm_workers}")
     
     # Initialize PID file management
     try:
         with PIDFileManager(process_name="bulk_processor") as pid_manager:
             log_callback("Bulk processor started with PID file management.")
-            return _run_bulk_processing(args.batch_size, logger)
+            return _run_bulk_processing(args.batch_size, logger, llm_workers=args.llm_workers,
+                                        full_scan=args.full_scan)
     except RuntimeError as e:
         log_callback(f"❌ Failed to start bulk processor: {e}")
         return False
 
-def _run_bulk_processing(batch_size, logger):
+def _run_bulk_processing(batch_size, logger, llm_workers=1, full_scan=False):
     """Main bulk processing logic extracted for PID file management."""
     
-    # Initialize the Gmail cleaner
-    cleaner = GmailLMCleaner()
+    # Initialize the Gmail cleaner; both phases draw Gmail calls from one
+    # per-user quota bucket instead of backing off on rate-limit errors
+    cleaner = GmailLMCleaner(rate_limiter=QuotaTokenBucket())
     
     print("\n📧 Connecting to Gmail...")
     if not cleaner.ensure_gmail_connection():
@@ -132,6 +170,11 @@ def _run_bulk_processing(batch_size, logger):
     
     log_callback("✅ Gmail connection established!")
     
+    # Modules, settings and the API client live for the whole run; moving them
+    # out of the collected generations keeps GC passes over the backlog short
+    gc.collect()
+    gc.freeze()
+    
     # Get initial email count
     try:
         inbox_label = cleaner.service.users().labels().get(userId='me', id='INBOX').execute()
@@ -139,11 +182,27 @@ def _run_bulk_processing(batch_size, logger):
         log_callback(f"📊 Found {total_unread} unread emails in inbox before processing.")
     except Exception as e:
         log_callback(f"⚠️ Could not get initial email count: {e}")
-        total_unread = 0
+        total_unread = None
+
+    # Read the history ID before processing so mail arriving mid-run is
+    # picked up next time, then list what arrived since the last run
+    email_manager = GmailEmailManager(cleaner.service, cleaner.rate_limiter)
+    run_history_id = email_manager.get_history_id()
+    new_message_ids = None
+    last_history_id = None if full_scan else _load_history_id()
+    if last_history_id:
+        new_message_ids = email_manager.list_added_message_ids(last_history_id)
+        if new_message_ids is None:
+            log_callback("⚠️ Mailbox history since the last run is unavailable; scanning the whole inbox.")
+        else:
+            log_callback(f"📬 {len(new_message_ids)} emails arrived in the inbox since the last run.")
 
     start_time = datetime.now()
 
-    # Phase 1: Server-Side Filtering
+    # Phase 1: Server-Side Filtering. This still scans the whole mailbox on
+    # incremental runs: Gmail already applies filters to mail as it arrives,
+    # so what this pass adds is applying new or changed filters to older mail,
+    # which the history delta cannot cover.
     server_stats, applied_labels = run_server_side_filter_pass(cleaner, log_callback)
     
     # Phase 2: LLM processing for the remainder
@@ -151,9 +210,18 @@ def _run_bulk_processing(batch_size, logger):
     
     # Construct a query to exclude emails that have already been processed by filters
     exclusion_query = "is:unread in:inbox"
+    applied_label_ids = []
     if applied_labels:
-        # Create -label:LabelName for each label applied
-        label_exclusions = [f"-label:{label.replace(' ', '-')}" for label in applied_labels]
+        # Exclude by label ID: IDs are canonical, whereas names with spaces or
+        # punctuation don't reliably match Gmail's query syntax. One
+        # labels.list call resolves them all.
+        label_ids = GmailLabelManager(cleaner.service).list_labels()
+        label_exclusions = []
+        for label in applied_labels:
+            label_id = label_ids.get(label)
+            label_exclusions.append(f"-label:{label_id or label.replace(' ', '-')}")
+            if label_id:
+                applied_label_ids.append(label_id)
         exclusion_query += " " + " ".join(label_exclusions)
         log_callback(f"🧠 LLM will process emails NOT matching labels: {', '.join(applied_labels)}")
     else:
@@ -161,6 +229,15 @@ def _run_bulk_processing(batch_size, logger):
         
     log_callback(f"🔍 Using query for LLM processing: {exclusion_query}")
 
+    if new_message_ids is not None:
+        log_callback("🔍 Only emails added since the last run are considered.")
+        unread_count = len(new_message_ids)
+    elif server_stats.get('server_side_processed', 0) == 0:
+        # Phase 1 changed nothing, so the count read above is still current
+        unread_count = total_unread
+    else:
+        unread_count = None
+
     llm_stats = {}
     try:
         llm_stats = cleaner.process_email_backlog(
@@ -169,7 +246,12 @@ def _run_bulk_processing(batch_size, logger):
             query_override=exclusion_query,
             log_callback=log_callback,
             progress_callback=progress_callback,
-            pause_callback=pause_callback
+            pause_callback=pause_callback,
+            apply_filters=False,  # Phase 1 already applied them
+            llm_workers=llm_workers,
+            unread_count=unread_count,
+            message_ids=new_message_ids,
+            skip_label_ids=applied_label_ids
         )
         log_callback("✅ LLM processing complete.")
     except (GmailAPIError, EmailProcessingError, LLMConnectionError) as e:
@@ -177,6 +259,13 @@ def _run_bulk_processing(batch_size, logger):
     except Exception as e:
         log_callback(f"❌ An unexpected error occurred during LLM processing: {e}")
 
+    # Only a run that reached the end of the listing may move the history
+    # ID forward; otherwise unprocessed mail would be skipped by later runs
+    if llm_stats.get('completed') and run_history_id:
+        _save_history_id(run_history_id)
+    elif run_history_id:
+        log_callback("⚠️ LLM pass did not finish; the next run will revisit the same emails.")
+
     # Final summary
     end_time = datetime.now()
     duration = end_time - start_time
@@ -207,7 +296,7 @@ def _run_bulk_processing(batch_size, logger):
         
         if remaining_unread == 0:
             print("🎉 INBOX ZERO ACHIEVED! 🎉")
-        elif total_unread > 0:
+        elif total_unread:
             processed_percentage = ((total_unread - remaining_unread) / total_unread) * 100
             print(f"📈 Cleanup progress: {processed_percentage:.1f}%")
     except Exception as e:
@@ -8,10 +8,44 @@ import subprocess
 import os
 from datetime import datetime
 from gmail_api_utils import get_gmail_service
+from pid_utils import PIDFileManager
+
+def _find_process_pids(pattern):
+    """PIDs whose command line contains pattern, read from /proc (Linux)."""
+    needle = pattern.encode()
+    own_pid = os.getpid()
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == own_pid:
+            continue
+        try:
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                if needle in f.read():
+                    pids.append(entry)
+        except OSError:
+            continue  # Process exited or is not readable
+    return pids
 
 def get_process_status():
     """Check if bulk processor is running."""
     try:
+        # bulk_processor.py records its PID here; checking it needs no scan
+        pid = PIDFileManager(process_name="bulk_processor").get_stored_pid()
+        if pid:
+            try:
+                os.kill(pid, 0)
+                return f"✅ Running (PID: {pid})"
+            except PermissionError:
+                return f"✅ Running (PID: {pid})"
+            except OSError:
+                pass  # Stale PID file; fall back to scanning
+        
+        if os.path.isdir('/proc'):
+            pids = _find_process_pids('bulk_processor.py')
+            if pids:
+                return f"✅ Running (PID: {' '.join(pids)})"
+            return "❌ Not running"
+        
         result = subprocess.run(['pgrep', '-f', 'bulk_processor.py'], 
                               capture_output=True, text=True)
         if result.returncode == 0:
@@ -39,17 +73,20 @@ def get_processing_stats():
     """Get processing statistics from logs."""
     try:
         if os.path.exists('logs/email_processing.log'):
-            with open('logs/email_processing.log', 'r') as f:
-                lines = f.readlines()
-            
-            processed_count = sum(1 for line in lines if 'Processed:' in line)
+            # One streaming pass in binary mode: memory stays at one line
+            # however large the log is, and the last match is kept as we go
+            processed_count = 0
+            latest_line = None
+            with open('logs/email_processing.log', 'rb') as f:
+                for line in f:
+                    if b'Processed:' in line:
+                        processed_count += 1
+                        latest_line = line
             
             # Get latest processing time
-            for line in reversed(lines):
-                if 'Processed:' in line:
-                    timestamp = line.split()[0:2]
-                    latest_time = ' '.join(timestamp)
-                    break
+            if latest_line is not None:
+                timestamp = latest_line.decode('utf-8', errors='replace').split()[0:2]
+                latest_time = ' '.join(timestamp)
             else:
                 latest_time = "No recent activity"
             
@@ -48,6 +48,9 @@ class CronJob:
         self.cron_expr = cron_expr
         self.last_run = last_run
         self.status = status
+        # (cron_expr, last_run, next due time) so the cron expression is only
+        # re-parsed when the schedule or last_run changes, not on every tick
+        self._next_due_cache = None
 
     def next_run(self, from_time: Optional[datetime] = None) -> datetime:
         """
@@ -82,12 +85,30 @@ class CronJob:
         now = now or datetime.utcnow()
         if self.last_run is None:
             return True
+        next_run = self.next_due_time()
+        return next_run is not None and now >= next_run
+
+    def next_due_time(self) -> Optional[datetime]:
+        """
+        Time at which the job next becomes due.
+
+        Returns:
+            datetime or None: The first scheduled run after last_run (UTC), or
+            None if the job has never run (it is due immediately) or its cron
+            expression is invalid.
+        """
+        if self.last_run is None:
+            return None
+        cached = self._next_due_cache
+        if cached is not None and cached[:2] == (self.cron_expr, self.last_run):
+            return cached[2]
         try:
-            next_run = croniter(self.cron_expr, self.last_run).get_next(datetime)
-            return now >= next_run
+            next_due = croniter(self.cron_expr, self.last_run).get_next(datetime)
         except (CroniterBadCronError, CroniterBadDateError) as e:
             logger.error(f"CronJob[{self.name}]: Invalid cron expression '{self.cron_expr}': {e}")
-            return False
+            next_due = None
+        self._next_due_cache = (self.cron_expr, self.last_run, next_due)
+        return next_due
 
     def update_last_run(self, run_time: Optional[datetime] = None, status: str = "success"):
         """
@@ -252,6 +273,29 @@ class CronScheduler:
         except Exception:
             return None
 
+    def seconds_until_next_due(self, now: Optional[datetime] = None) -> float:
+        """
+        Seconds until the earliest job becomes due, for sleeping between checks.
+
+        Args:
+            now (datetime, optional): Current time (default: now UTC).
+
+        Returns:
+            float: 0.0 if a job is already due (or has never run), otherwise the
+            time until the next due job. Jobs with invalid cron expressions are
+            ignored; with no schedulable jobs, returns infinity.
+        """
+        now = now or datetime.utcnow()
+        earliest = float("inf")
+        for job in self.jobs.values():
+            if job.last_run is None:
+                return 0.0
+            due_at = job.next_due_time()
+            if due_at is None:
+                continue
+            earliest = min(earliest, (due_at - now).total_seconds())
+        return max(earliest, 0.0)
+
     def get_job_status(self, job_name: str) -> Optional[str]:
         """
         Get the last known status for a job.
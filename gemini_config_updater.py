@@ -3,6 +3,11 @@ import json
 import os
 import sys
 
+try:
+    import orjson  # Optional: faster Gemini output parsing and settings writes
+except ImportError:
+    orjson = None
+
 from log_config import init_logging, get_logger
 
 SETTINGS_PATH = "config/settings.json"
@@ -12,10 +17,27 @@ def load_settings(settings_path):
         return json.load(f)
 
 def save_settings(settings, settings_path):
-    with open(settings_path, "w") as f:
-        json.dump(settings, f, indent=2, sort_keys=False)
+    # Serialize before touching the file and swap the new file in whole, so
+    # a value the encoder rejects can never leave settings.json empty
+    data = None
+    if orjson is not None:
+        try:
+            data = orjson.dumps(settings, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            # e.g. non-str keys or integers wider than 64 bits, which the
+            # stdlib encoder coerces or accepts
+            pass
+    if data is None:
+        data = json.dumps(settings, indent=2, sort_keys=False).encode("utf-8")
+    tmp_path = settings_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, settings_path)
 
 def load_gemini_output(path):
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     with open(path, "r") as f:
         return json.load(f)
 
@@ -87,36 +109,21 @@ def update_label_action_mappings(settings, category_rules, logger):
             updated = True
     return updated
 
-def main():
-    parser = argparse.ArgumentParser(description="Update system config/rules from Gemini output JSON.")
-    parser.add_argument("--gemini-output", type=str, help="Path to Gemini output JSON file.")
-    parser.add_argument("--settings", type=str, default=SETTINGS_PATH, help="Path to settings.json.")
-    args = parser.parse_args()
+def apply_gemini_output(gemini_output_path, settings_path=SETTINGS_PATH, logger=None, settings=None):
+    """
+    Apply a Gemini output JSON file to the label schema, rule files and settings.
 
-    # Load settings
-    try:
-        settings = load_settings(args.settings)
-    except Exception as e:
-        print(f"Error loading settings: {e}", file=sys.stderr)
-        sys.exit(1)
+    Loading errors for the settings or Gemini output propagate; failures in the
+    individual update steps are logged and the remaining steps still run.
+    settings may be passed if already loaded from settings_path; it is updated
+    in place and saved back.
+    """
+    if logger is None:
+        logger = get_logger(__name__)
 
-    # Initialize logging
-    log_dir = settings.get("paths", {}).get("logs", "logs")
-    init_logging(log_dir=log_dir)
-    logger = get_logger(__name__)
-
-    # Determine Gemini output path
-    gemini_output_path = args.gemini_output
-    if not gemini_output_path:
-        logger.error("No Gemini output file specified. Use --gemini-output.")
-        sys.exit(1)
-
-    # Load Gemini output
-    try:
-        gemini = load_gemini_output(gemini_output_path)
-    except Exception as e:
-        logger.error(f"Failed to load Gemini output: {e}")
-        sys.exit(1)
+    if settings is None:
+        settings = load_settings(settings_path)
+    gemini = load_gemini_output(gemini_output_path)
 
     # Update label schema
     try:
@@ -148,12 +155,43 @@ def main():
     try:
         updated = update_label_action_mappings(settings, gemini.get("category_rules", {}), logger)
         if updated:
-            save_settings(settings, args.settings)
-            logger.info(f"Updated label_action_mappings in {args.settings}")
+            save_settings(settings, settings_path)
+            logger.info(f"Updated label_action_mappings in {settings_path}")
     except Exception as e:
         logger.error(f"Error updating label_action_mappings: {e}")
 
     logger.info("Gemini config update complete.")
 
+def main():
+    parser = argparse.ArgumentParser(description="Update system config/rules from Gemini output JSON.")
+    parser.add_argument("--gemini-output", type=str, help="Path to Gemini output JSON file.")
+    parser.add_argument("--settings", type=str, default=SETTINGS_PATH, help="Path to settings.json.")
+    args = parser.parse_args()
+
+    # Load settings
+    try:
+        settings = load_settings(args.settings)
+    except Exception as e:
+        print(f"Error loading settings: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Initialize logging
+    log_dir = settings.get("paths", {}).get("logs", "logs")
+    init_logging(log_dir=log_dir)
+    logger = get_logger(__name__)
+
+    # Determine Gemini output path
+    gemini_output_path = args.gemini_output
+    if not gemini_output_path:
+        logger.error("No Gemini output file specified. Use --gemini-output.")
+        sys.exit(1)
+
+    # Load Gemini output and apply it
+    try:
+        apply_gemini_output(gemini_output_path, args.settings, logger, settings=settings)
+    except Exception as e:
+        logger.error(f"Failed to load Gemini output: {e}")
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
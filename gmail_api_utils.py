@@ -20,16 +20,18 @@ See README.md for setup instructions.
 
 import logging
 import os.path
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Tuple
 
+import google_auth_httplib2
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import BatchHttpRequest
 import time
 import random
+import threading
 
 from log_config import get_logger
 
@@ -42,10 +44,64 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.send'
 ]
 
+# Socket timeout for Gmail API requests
+GMAIL_HTTP_TIMEOUT_SECONDS = 30
+
+# Gmail API per-user rate limit and the quota cost of the calls we make
+# (https://developers.google.com/gmail/api/reference/quota)
+GMAIL_QUOTA_UNITS_PER_SECOND = 250
+GMAIL_QUOTA_COSTS = {
+    'messages.get': 5,
+    'messages.list': 5,
+    'messages.modify': 5,
+    'messages.trash': 5,
+    'messages.untrash': 5,
+    'messages.delete': 10,
+    'messages.batchModify': 50,
+    'messages.batchDelete': 50,
+    'history.list': 2,
+    'getProfile': 1,
+    'watch': 100,
+}
+
 # =========================
 # Utility Functions
 # =========================
 
+class QuotaTokenBucket:
+    """
+    Thread-safe token bucket measured in Gmail API quota units.
+
+    Args:
+        rate (float): Units refilled per second (default: the per-user limit).
+        capacity (float, optional): Maximum burst size (default: rate).
+
+    Usage Example:
+        limiter = QuotaTokenBucket()
+        limiter.acquire(GMAIL_QUOTA_COSTS['messages.batchModify'])
+    """
+
+    def __init__(self, rate: float = GMAIL_QUOTA_UNITS_PER_SECOND, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units: float = 1):
+        """Consume `units` quota units, blocking until the balance is non-negative."""
+        # Requests larger than the bucket are charged in full: the balance
+        # goes into debt and the caller (and anyone after it) waits it off,
+        # so the long-run rate never exceeds `rate`.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= units
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
 def exponential_backoff_retry(func, max_retries: int = 3, base_delay: float = 1.0):
     """
     Execute a function with exponential backoff retry logic.
@@ -162,8 +218,14 @@ def get_gmail_service(credentials_path: str = "config/credentials.json", token_p
                 except Exception as save_error:
                     logger.warning(f"Failed to save token file: {save_error}")
             
-            # Build and test the Gmail service
-            service = build('gmail', 'v1', credentials=creds)
+            # Build and test the Gmail service. The service keeps one
+            # authorized httplib2.Http for its lifetime, so its keep-alive
+            # connection to the API is reused across calls; the discovery
+            # document ships with the client, so the disk cache is skipped.
+            authed_http = google_auth_httplib2.AuthorizedHttp(
+                creds, http=httplib2.Http(timeout=GMAIL_HTTP_TIMEOUT_SECONDS)
+            )
+            service = build('gmail', 'v1', http=authed_http, cache_discovery=False)
             
             # Test the connection with a simple API call
             try:
@@ -382,16 +444,24 @@ class GmailEmailManager:
 
     Args:
         service: Authenticated Gmail API service object.
+        rate_limiter (QuotaTokenBucket, optional): Shared quota limiter that
+            batch operations draw from before each API call.
 
     Usage Example:
         email_mgr = GmailEmailManager(service)
         emails = email_mgr.list_emails(label_ids=['INBOX'], max_results=10)
     """
 
-    def __init__(self, service):
+    def __init__(self, service, rate_limiter: Optional[QuotaTokenBucket] = None):
         self.service = service
+        self.rate_limiter = rate_limiter
         self.logger = get_logger(self.__class__.__name__)
 
+    def _throttle(self, method: str, count: int = 1):
+        """Wait for quota for `count` calls of `method` if a rate limiter is set."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(GMAIL_QUOTA_COSTS.get(method, 5) * count)
+
     def list_emails(self, label_ids: Optional[List[str]] = None, query: Optional[str] = None,
                    max_results: int = 100) -> List[Dict[str, Any]]:
         """
@@ -425,6 +495,137 @@ class GmailEmailManager:
             self.logger.error(f"Failed to list emails after retries: {e}")
             return []
 
+    def get_history_id(self) -> Optional[str]:
+        """
+        Get the mailbox's current history ID, the starting point for has_new_messages.
+
+        Returns:
+            str or None: Current historyId, or None on failure.
+
+        Usage Example:
+            history_id = email_mgr.get_history_id()
+        """
+        def _get_profile():
+            self._throttle('getProfile')
+            return self.service.users().getProfile(userId='me').execute()
+
+        try:
+            return str(exponential_backoff_retry(_get_profile)['historyId'])
+        except Exception as e:
+            self.logger.error(f"Failed to get mailbox history ID: {e}")
+            return None
+
+    def has_new_messages(self, start_history_id: str, label_id: str = 'INBOX') -> Tuple[bool, Optional[str]]:
+        """
+        Check whether any message was added to a label since start_history_id.
+
+        Uses users.history.list, which only returns changes, so polling an
+        unchanged mailbox costs one cheap call instead of a message search.
+
+        Args:
+            start_history_id (str): History ID from get_history_id or a previous call.
+            label_id (str): Only count messages added with this label.
+
+        Returns:
+            tuple: (changed, latest_history_id). changed is True (and
+            latest_history_id None) when the history cannot be read, e.g. the
+            start ID has expired, so callers fall back to a full listing.
+
+        Usage Example:
+            changed, history_id = email_mgr.has_new_messages(history_id)
+        """
+        def _list_history():
+            self._throttle('history.list')
+            return self.service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                labelId=label_id,
+                maxResults=1
+            ).execute()
+
+        try:
+            response = exponential_backoff_retry(_list_history)
+        except Exception as e:
+            self.logger.warning(f"Failed to read mailbox history since {start_history_id}: {e}")
+            return True, None
+        return bool(response.get('history')), response.get('historyId')
+
+    def list_added_message_ids(self, start_history_id: str, label_id: str = 'INBOX') -> Optional[List[str]]:
+        """
+        List the IDs of messages added to a label since start_history_id.
+
+        Pages through users.history.list, so the cost grows with the number
+        of changes rather than with the size of the mailbox.
+
+        Args:
+            start_history_id (str): History ID saved by an earlier run.
+            label_id (str): Only include messages added with this label.
+
+        Returns:
+            list or None: Message IDs in the order they were added, or None
+            when the history cannot be read (e.g. the start ID has expired),
+            so callers fall back to a full listing.
+
+        Usage Example:
+            msg_ids = email_mgr.list_added_message_ids(history_id)
+        """
+        history = self.service.users().history()
+        request = history.list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded'],
+            labelId=label_id,
+            maxResults=500
+        )
+        msg_ids = {}  # dict keeps first-seen order without duplicates
+        try:
+            while request is not None:
+                self._throttle('history.list')
+                response = exponential_backoff_retry(request.execute)
+                for record in response.get('history', []):
+                    for added in record.get('messagesAdded', []):
+                        msg_ids[added['message']['id']] = None
+                request = history.list_next(request, response)
+        except Exception as e:
+            self.logger.warning(f"Failed to read mailbox history since {start_history_id}: {e}")
+            return None
+        return list(msg_ids)
+
+    def watch_mailbox(self, topic_name: str, label_ids: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Register (or renew) Gmail push notifications to a Cloud Pub/Sub topic.
+
+        Gmail publishes the mailbox's new historyId to the topic whenever the
+        watched labels change. A watch lasts 7 days and should be renewed
+        daily.
+
+        Args:
+            topic_name (str): Full topic name, "projects/<project>/topics/<topic>".
+            label_ids (list, optional): Only notify for changes to these labels.
+
+        Returns:
+            dict or None: Watch response with 'historyId' and 'expiration'
+            (epoch milliseconds), or None on failure.
+
+        Usage Example:
+            email_mgr.watch_mailbox("projects/my-project/topics/gmail-events", ['INBOX'])
+        """
+        body = {'topicName': topic_name}
+        if label_ids:
+            body['labelIds'] = label_ids
+            body['labelFilterBehavior'] = 'include'
+
+        def _watch():
+            self._throttle('watch')
+            return self.service.users().watch(userId='me', body=body).execute()
+
+        try:
+            return exponential_backoff_retry(_watch)
+        except Exception as e:
+            self.logger.error(f"Failed to register Gmail push notifications to {topic_name}: {e}")
+            return None
+
     def get_email(self, msg_id: str) -> Optional[Dict[str, Any]]:
         """
         Get a single email by message ID.
@@ -603,13 +804,66 @@ class GmailEmailManager:
         
         return results
 
+    def batch_modify_labels(self, msg_ids: List[str], add_labels: Optional[List[str]] = None,
+                            remove_labels: Optional[List[str]] = None, chunk_size: int = 1000) -> Dict[str, bool]:
+        """
+        Apply the same label changes to many emails with messages.batchModify.
+
+        Unlike batch_modify, which sends one modify request per message, this
+        issues a single API call per chunk of up to 1000 message IDs.
+
+        Args:
+            msg_ids (list): List of Gmail message IDs.
+            add_labels (list, optional): Label IDs to add.
+            remove_labels (list, optional): Label IDs to remove.
+            chunk_size (int): Number of message IDs per batchModify call (max 1000).
+
+        Returns:
+            dict: Mapping of msg_id to success status.
+
+        Usage Example:
+            results = email_mgr.batch_modify_labels(msg_ids, add_labels=['INBOX'], remove_labels=['TRASH'])
+        """
+        if not msg_ids:
+            return {}
+
+        body = {}
+        if add_labels:
+            body['addLabelIds'] = add_labels
+        if remove_labels:
+            body['removeLabelIds'] = remove_labels
+        if not body:
+            self.logger.warning("No labels specified for modification.")
+            return {msg_id: False for msg_id in msg_ids}
+
+        results = {}
+        chunk_size = min(chunk_size, 1000)  # Gmail API limit for batchModify
+
+        for i in range(0, len(msg_ids), chunk_size):
+            chunk = msg_ids[i:i + chunk_size]
+
+            def _batch_modify():
+                self._throttle('messages.batchModify')
+                return self.service.users().messages().batchModify(
+                    userId='me', body=dict(body, ids=chunk)).execute()
+
+            try:
+                exponential_backoff_retry(_batch_modify)
+                self.logger.info(f"Modified labels for {len(chunk)} emails: {body}")
+                results.update((msg_id, True) for msg_id in chunk)
+            except Exception as e:
+                self.logger.error(f"Failed to batch modify labels for {len(chunk)} emails: {e}")
+                results.update((msg_id, False) for msg_id in chunk)
+
+        return results
+
     def _execute_batch_modify_chunk(self, msg_ids: List[str], add_labels: Optional[List[str]], 
                                    remove_labels: Optional[List[str]]) -> Dict[str, bool]:
         """Execute a single batch modification chunk."""
         results = {}
         
         def execute_batch():
-            batch = BatchHttpRequest()
+            batch = self.service.new_batch_http_request()
             
             # Prepare the request body
             modify_body = {}
@@ -640,6 +894,7 @@ class GmailEmailManager:
                 batch.add(request, callback=callback, request_id=msg_id)
             
             # Execute the batch
+            self._throttle('messages.modify', len(msg_ids))
             batch.execute()
             return results
         
@@ -687,7 +942,7 @@ class GmailEmailManager:
         results = {}
         
         def execute_batch():
-            batch = BatchHttpRequest()
+            batch = self.service.new_batch_http_request()
             
             # Add each message deletion to the batch
             for msg_id in msg_ids:
@@ -703,6 +958,7 @@ class GmailEmailManager:
                 batch.add(request, callback=callback, request_id=msg_id)
             
             # Execute the batch
+            self._throttle('messages.delete', len(msg_ids))
             batch.execute()
             return results
         
@@ -790,7 +1046,7 @@ class GmailEmailManager:
         results = {}
         
         def execute_batch():
-            batch = BatchHttpRequest()
+            batch = self.service.new_batch_http_request()
             
             # Add each message get to the batch
             for msg_id in msg_ids:
@@ -811,6 +1067,7 @@ class GmailEmailManager:
                 batch.add(request, callback=callback, request_id=msg_id)
             
             # Execute the batch
+            self._throttle('messages.get', len(msg_ids))
             batch.execute()
             return results
         
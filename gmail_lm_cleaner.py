@@ -17,9 +17,11 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 from dotenv import load_dotenv
 import google.generativeai as genai
-from gmail_api_utils import get_gmail_service, GmailLabelManager
+from gmail_api_utils import get_gmail_service, GmailLabelManager, GmailEmailManager, GMAIL_QUOTA_COSTS
 from gemini_config_updater import update_label_schema, update_category_rules, update_label_action_mappings
 from tools.filter_harvester import apply_existing_filters_to_backlog
 from exceptions import (GmailAPIError, EmailProcessingError, LLMConnectionError, 
@@ -41,6 +43,16 @@ load_dotenv()
 LM_STUDIO_URL = "http://localhost:1234/v1/chat/completions"
 LM_STUDIO_MODELS_URL = "http://localhost:1234/v1/models"
 
+# One requests.Session per thread (Session is not thread-safe), so repeated
+# LM Studio calls from the same worker reuse a keep-alive connection
+_lm_studio_sessions = threading.local()
+
+def _lm_studio_session():
+    session = getattr(_lm_studio_sessions, "session", None)
+    if session is None:
+        session = _lm_studio_sessions.session = requests.Session()
+    return session
+
 from lm_studio_integration import lm_studio
 
 # Settings configuration
@@ -672,19 +684,35 @@ class EmailLearningEngine:
             return {'total_records': 0, 'accuracy_rate': 0.0, 'top_categories': []}
 
 class GmailLMCleaner:
-    def __init__(self, credentials_file='config/credentials.json', token_file='config/token.json', settings_file='config/settings.json'):
+    def __init__(self, credentials_file='config/credentials.json', token_file='config/token.json', settings_file='config/settings.json',
+                 settings=None, service=None, rate_limiter=None):
+        """
+        settings: already-parsed settings.json contents to use instead of
+            re-reading settings_file (not mutated; defaults are merged into a copy).
+        service: an authenticated Gmail service to reuse instead of creating one.
+        rate_limiter: a gmail_api_utils.QuotaTokenBucket that batched Gmail
+            calls draw quota units from (no throttling if None).
+        """
         self.credentials_file = credentials_file
         self.token_file = token_file
         self.settings_file = settings_file
-        self.service = None
-        self.settings = self.load_settings()
+        self.service = service
+        self.rate_limiter = rate_limiter
+        self.settings = self.load_settings(settings)
         self.llm_prompts = self.load_llm_prompts() # Load LLM prompts
         self.logger = self.setup_logging()
         self.learning_engine = EmailLearningEngine()
-        self.setup_gmail_service()
-        
-    def load_settings(self):
-        """Load settings from file or create default."""
+        if self.service is None:
+            self.setup_gmail_service()
+        
+    def load_settings(self, settings=None):
+        """Load settings from file (or use the given parsed settings) or create default."""
+        if settings is not None:
+            settings = dict(settings)
+            # Merge with defaults in case new settings were added
+            for key, value in DEFAULT_SETTINGS.items():
+                settings.setdefault(key, value)
+            return settings
         if os.path.exists(self.settings_file):
             try:
                 with open(self.settings_file, 'r') as f:
@@ -741,15 +769,9 @@ class GmailLMCleaner:
                         f"Decision: {decision} | Reason: {reason}{confidence_str}")
     
     def load_llm_prompts(self):
-        """Load LLM prompts from settings file."""
-        if os.path.exists(self.settings_file):
-            try:
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
-                    return settings.get("llm_prompts", {})
-            except:
-                pass
-        return {}
+        """Load LLM prompts from the already-loaded settings."""
+        # DEFAULT_SETTINGS has no llm_prompts, so this matches re-reading the file
+        return self.settings.get("llm_prompts", {})
 
     def save_settings(self):
         """Save current settings to file."""
@@ -814,21 +836,7 @@ class GmailLMCleaner:
                 format='full'
             ).execute()
             
-            headers = message.get('payload', {}).get('headers', [])
-            subject = next((h['value'] for h in headers if h.get('name') == 'Subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h.get('name') == 'From'), 'Unknown Sender')
-            date = next((h['value'] for h in headers if h.get('name') == 'Date'), 'Unknown Date')
-            
-            body = self.extract_body(message.get('payload', {}))
-            
-            return {
-                'id': msg_id,
-                'subject': subject,
-                'sender': sender,
-                'date': date,
-                'body': body[:1000] if body else '',
-                'labels': message.get('labelIds', [])
-            }
+            return self._parse_email_message(msg_id, message)
         except Exception as e:
             if hasattr(self, 'logger'):
                 self.logger.error(f"Error fetching email {msg_id}: {e}")
@@ -836,6 +844,52 @@ class GmailLMCleaner:
                 print(f"Error fetching email {msg_id}: {e}")
             return None
     
+    def get_email_contents_batch(self, msg_ids, messages=None):
+        """Fetch and decode many emails, 100 messages.get calls per HTTP batch.
+        
+        messages may hold raw format='full' messages already fetched elsewhere
+        (e.g. prefetched on another Gmail service); they are decoded as-is.
+        Returns a dict of msg_id -> email data (None if it could not be fetched).
+        Messages the batch request failed on are retried one at a time.
+        """
+        msg_ids = list(msg_ids)
+        if messages is None:
+            messages = GmailEmailManager(self.service, self.rate_limiter).batch_get_messages(msg_ids, format='full')
+        
+        contents = {}
+        for msg_id in msg_ids:
+            message = messages.get(msg_id)
+            if message is None:
+                contents[msg_id] = self.get_email_content(msg_id)
+                continue
+            try:
+                contents[msg_id] = self._parse_email_message(msg_id, message)
+            except Exception as e:
+                if hasattr(self, 'logger'):
+                    self.logger.error(f"Error decoding email {msg_id}: {e}")
+                else:
+                    print(f"Error decoding email {msg_id}: {e}")
+                contents[msg_id] = None
+        return contents
+    
+    def _parse_email_message(self, msg_id, message):
+        """Build the email data dict from a format='full' Gmail message."""
+        headers = message.get('payload', {}).get('headers', [])
+        subject = next((h['value'] for h in headers if h.get('name') == 'Subject'), 'No Subject')
+        sender = next((h['value'] for h in headers if h.get('name') == 'From'), 'Unknown Sender')
+        date = next((h['value'] for h in headers if h.get('name') == 'Date'), 'Unknown Date')
+        
+        body = self.extract_body(message.get('payload', {}))
+        
+        return {
+            'id': msg_id,
+            'subject': subject,
+            'sender': sender,
+            'date': date,
+            'body': body[:1000] if body else '',
+            'labels': message.get('labelIds', [])
+        }
+    
     def extract_body(self, payload):
         """Extract email body from payload."""
         body = ""
@@ -1454,7 +1508,7 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
             if model_name and model_name != 'auto':
                 payload['model'] = model_name
             
-            response = requests.post(
+            response = _lm_studio_session().post(
                 LM_STUDIO_URL,
                 json=payload,
                 timeout=timeout,
@@ -2279,6 +2333,55 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
             if log_callback:
                 log_callback(f"  ✗ Error executing action: {e}")
     
+    def execute_actions_batch(self, decisions, log_callback=None, audit_callback=None):
+        """Execute many decided actions with one messages.batchModify per label change.
+        
+        decisions is a list of (email_id, action, reason). Emails sharing an
+        action are moved together instead of with a trash/modify call each.
+        audit_callback, if given, is called as audit_callback(action_type,
+        email_id, label, reason) for every email changed, using the action
+        types audit_tool can restore. Returns a dict of email_id -> success.
+        """
+        results = {}
+        groups = {}
+        label_ids = {}
+        for email_id, action, reason in decisions:
+            if action == "JUNK":
+                change = (('TRASH',), ('INBOX',), "TRASH", None)
+            elif action == "INBOX":
+                change = (('IMPORTANT',), (), "LABEL", 'IMPORTANT')
+            else:
+                if action not in label_ids:
+                    label_ids[action] = self.create_label_if_not_exists(action)
+                label_id = label_ids[action]
+                if not label_id:
+                    if log_callback:
+                        log_callback(f"  ✗ Failed to create label for {action}")
+                    results[email_id] = False
+                    continue
+                change = ((label_id,), ('INBOX',), "LABEL_AND_ARCHIVE", label_id)
+            groups.setdefault(change, []).append((email_id, action, reason))
+        
+        email_manager = GmailEmailManager(self.service, self.rate_limiter)
+        for (add_labels, remove_labels, action_type, label), group in groups.items():
+            outcome = email_manager.batch_modify_labels(
+                [email_id for email_id, _, _ in group],
+                add_labels=list(add_labels),
+                remove_labels=list(remove_labels)
+            )
+            for email_id, action, reason in group:
+                success = outcome.get(email_id, False)
+                results[email_id] = success
+                if not success:
+                    if log_callback:
+                        log_callback(f"  ✗ Error executing action {action} on {email_id}")
+                    continue
+                if audit_callback:
+                    audit_callback(action_type, email_id, label, reason)
+                if log_callback:
+                    log_callback(f"  ✓ {action}: {reason}")
+        return results
+    
     def process_inbox(self, log_callback=None):
         """Process emails from all categories in newest to oldest order."""
         if log_callback:
@@ -2360,7 +2463,7 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
             self.learning_engine.suggest_rule_updates()
             self.learning_engine.detect_new_patterns()
     
-    def process_email_backlog(self, batch_size=100, older_than_days=0, query_override=None, log_callback=None, progress_callback=None, pause_callback=None):
+    def process_email_backlog(self, batch_size=100, older_than_days=0, query_override=None, log_callback=None, progress_callback=None, pause_callback=None, apply_filters=True, llm_workers=1, unread_count=None, message_ids=None, skip_label_ids=None):
         """
         Process all unread emails to get to inbox zero.
         
@@ -2370,6 +2473,22 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
         - Log all actions for review
         - Option to process only emails older than X days
         - Returns processing statistics
+        
+        Existing Gmail filters are applied server-side once before the LLM
+        pass unless apply_filters is False (e.g. the caller already ran them).
+        Each batch's LLM decisions are applied with one messages.batchModify
+        per label change. With llm_workers > 1, that many LLM analyses of a
+        batch run concurrently; Gmail calls stay on the calling thread.
+        A caller that has just read the INBOX unread count can pass it as
+        unread_count to skip fetching it again.
+        
+        message_ids limits the run to those messages instead of searching
+        with the query (e.g. mail added since the last run). Any that are no
+        longer unread in the inbox, or carry a label in skip_label_ids, are
+        skipped.
+        
+        stats['completed'] is True only if every page was listed and processed;
+        stats['paused'] and stats['fetch_failed'] say why a run stopped early.
         """
         if log_callback:
             log_callback("🚀 Starting bulk unread email cleanup...")
@@ -2395,11 +2514,17 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
         stats = {
             'total_found': 0,
             'total_processed': 0,
-            'by_category': {},
+            'by_category': Counter(),
             'errors': 0,
             'batch_count': 0,
-            'start_time': datetime.now()
+            'start_time': datetime.now(),
+            # How the run ended: completed only once the whole listing is done
+            'completed': False,
+            'paused': False,
+            'fetch_failed': False
         }
+        llm_pool = ThreadPoolExecutor(max_workers=llm_workers) if llm_workers > 1 else None
+        skip_labels = set(skip_label_ids or ())
         
         try:
             # Ensure Gmail connection before starting
@@ -2417,8 +2542,11 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                 # Get the number of unread messages in the inbox.
                 # This is a reliable count for the most common use case.
                 # If the query is more complex (e.g., with 'older_than'), this count is an approximation.
-                inbox_label_data = self.service.users().labels().get(userId='me', id='INBOX').execute()
-                total_messages = inbox_label_data.get('messagesUnread', 0)
+                if unread_count is not None:
+                    total_messages = unread_count
+                else:
+                    inbox_label_data = self.service.users().labels().get(userId='me', id='INBOX').execute()
+                    total_messages = inbox_label_data.get('messagesUnread', 0)
                 
                 stats['total_found'] = total_messages
                 if log_callback:
@@ -2439,18 +2567,50 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                 log_callback(f"🚀 Processing 75k+ emails efficiently!")
                 log_callback(f"📊 Fetching {fetch_size} emails per API call, processing {batch_size} at a time")
             
+            if apply_filters:
+                # Apply existing Gmail filters server-side before LLM processing.
+                # This covers the whole mailbox, so it runs once, not per page.
+                if log_callback:
+                    log_callback("🔧 Applying existing Gmail filters first...")
+                filter_result = apply_existing_filters_to_backlog(
+                    self.service,
+                    progress_callback=lambda msg, prog: log_callback(f"🔧 {msg}") if log_callback else None,
+                    rate_limiter=self.rate_limiter
+                )
+                filter_processed = filter_result['processed_count']
+                filter_stats = filter_result['filter_stats']
+                if log_callback:
+                    if filter_processed == 0:
+                        log_callback("🔧 No existing Gmail filters applied")
+                    else:
+                        log_callback(f"🔧 Filters processed {filter_processed} emails")
+                        for filter_id, count in filter_stats.items():
+                            log_callback(f"  📋 Filter {filter_id}: {count} emails")
+                processed_count += filter_processed
+                stats['total_processed'] += filter_processed
+                stats['by_category']['FILTERED'] += filter_processed
+            
             retry_count = 0
             max_retries = 3
             
             while True:
                 try:
-                    # Fetch large chunk of email IDs efficiently
-                    results = self.service.users().messages().list(
-                        userId='me',
-                        q=query,
-                        maxResults=fetch_size,  # Fetch efficiently
-                        pageToken=next_page_token
-                    ).execute()
+                    if message_ids is not None:
+                        # Page through the caller's IDs; the token is an offset
+                        start = next_page_token or 0
+                        results = {'messages': [{'id': msg_id} for msg_id in message_ids[start:start + fetch_size]]}
+                        if start + fetch_size < len(message_ids):
+                            results['nextPageToken'] = start + fetch_size
+                    else:
+                        # Fetch large chunk of email IDs efficiently
+                        if self.rate_limiter is not None:
+                            self.rate_limiter.acquire(GMAIL_QUOTA_COSTS['messages.list'])
+                        results = self.service.users().messages().list(
+                            userId='me',
+                            q=query,
+                            maxResults=fetch_size,  # Fetch efficiently
+                            pageToken=next_page_token
+                        ).execute()
                     retry_count = 0  # Reset retry counter on success
                 except Exception as e:
                     if log_callback:
@@ -2461,6 +2621,7 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                     if retry_count >= max_retries:
                         if log_callback:
                             log_callback(f"❌ Failed to fetch emails after {max_retries} retries. Stopping processing.")
+                        stats['fetch_failed'] = True
                         break
                     
                     # Wait before retrying (exponential backoff)
@@ -2476,62 +2637,39 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                 if not messages:
                     if log_callback:
                         log_callback("✅ No more emails to process")
+                    stats['completed'] = True
                     break
                 
                 if log_callback:
-                    log_callback(f"📥 Fetched {len(messages)} emails, applying existing filters first...")
-                
-                # Apply existing Gmail filters before LLM processing
-                email_ids = [msg['id'] for msg in messages]
-                filter_result = apply_existing_filters_to_backlog(
-                    self.service, 
-                    email_ids,
-                    progress_callback=lambda msg, prog: log_callback(f"🔧 {msg}") if log_callback else None
-                )
-                
-                # Update statistics with filter results
-                filter_processed = filter_result['processed_count']
-                remaining_ids = filter_result['remaining_ids']
-                filter_stats = filter_result['filter_stats']
-                
-                if log_callback:
-                    if filter_processed == 0:
-                        log_callback(f"🔧 No existing Gmail filters applied - {len(remaining_ids)} emails need LLM analysis")
-                    else:
-                        log_callback(f"🔧 Filters processed {filter_processed} emails, {len(remaining_ids)} need LLM analysis")
-                        if filter_stats:
-                            for filter_id, count in filter_stats.items():
-                                log_callback(f"  📋 Filter {filter_id}: {count} emails")
+                    log_callback(f"📥 Fetched {len(messages)} emails for LLM analysis")
                 
-                # Create filtered message list for LLM processing
-                messages_for_llm = [msg for msg in messages if msg['id'] in remaining_ids]
-                
-                # Update processed count with filter results
-                processed_count += filter_processed
-                stats['total_processed'] += filter_processed
-                stats['by_category']['FILTERED'] = stats['by_category'].get('FILTERED', 0) + filter_processed
-                
-                if log_callback:
-                    if len(messages_for_llm) == 0:
-                        log_callback(f"✅ All {len(messages)} emails were handled by existing filters - no LLM processing needed")
-                    else:
-                        log_callback(f"📊 Processing {len(messages_for_llm)} emails with LLM (after filter pre-processing)")
-                
-                # Skip LLM processing if all emails were handled by filters
-                if len(messages_for_llm) == 0:
-                    # Very brief pause and continue to next page
-                    import time
-                    time.sleep(0.5)
-                    continue
-                
-                # Process remaining emails in smaller batches
-                for i in range(0, len(messages_for_llm), batch_size):
-                    sub_batch = messages_for_llm[i:i+batch_size]
+                # Process emails in smaller batches
+                for i in range(0, len(messages), batch_size):
+                    sub_batch = messages[i:i+batch_size]
                     stats['batch_count'] += 1
+                    # (email_id, action, reason) applied together after the batch
+                    decisions = []
                     
                     if log_callback:
                         log_callback(f"\n📦 Batch {stats['batch_count']}: Processing {len(sub_batch)} emails")
                     
+                    # Fetch the whole sub-batch in batched HTTP requests
+                    email_contents = self.get_email_contents_batch([msg['id'] for msg in sub_batch])
+                    if message_ids is not None:
+                        # Caller-supplied mail may have been read, archived or
+                        # labelled since it arrived; leave those alone
+                        for msg_id, email_data in list(email_contents.items()):
+                            labels = set(email_data.get('labels', [])) if email_data else set()
+                            if email_data and (not {'UNREAD', 'INBOX'} <= labels or labels & skip_labels):
+                                del email_contents[msg_id]
+                        sub_batch = [msg for msg in sub_batch if msg['id'] in email_contents]
+                    if llm_pool is not None:
+                        # Analyses run concurrently; results are consumed in order below
+                        analyses = {
+                            msg_id: llm_pool.submit(self.analyze_email_with_llm, email_data)
+                            for msg_id, email_data in email_contents.items() if email_data
+                        }
+                    
                     # Process each email in this sub-batch
                     for msg in sub_batch:
                         try:
@@ -2539,10 +2677,11 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                             if pause_callback and pause_callback():
                                 if log_callback:
                                     log_callback("⏸️ Processing paused by user")
+                                self._execute_backlog_decisions(decisions, stats, log_callback)
+                                stats['paused'] = True
                                 return stats
                             
-                            # Get email content
-                            email_data = self.get_email_content(msg['id'])
+                            email_data = email_contents.get(msg['id'])
                             if not email_data:
                                 stats['errors'] += 1
                                 continue
@@ -2553,12 +2692,15 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                                 log_callback(f"  📧 [{stats['total_processed']}] {subject_preview}...")
                             
                             # Analyze email
-                            decision = self.analyze_email_with_llm(email_data)
+                            if llm_pool is not None:
+                                decision = analyses[msg['id']].result()
+                            else:
+                                decision = self.analyze_email_with_llm(email_data)
                             action = decision['action']
                             reason = decision['reason']
                             
                             # Update statistics
-                            stats['by_category'][action] = stats['by_category'].get(action, 0) + 1
+                            stats['by_category'][action] += 1
                             stats['total_processed'] += 1
                             processed_count += 1
                             
@@ -2583,13 +2725,7 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                                 decision.get('confidence')
                             )
                             
-                            # Execute action
-                            self.execute_action(
-                                email_data['id'],
-                                action,
-                                reason,
-                                None  # Skip detailed action logging to speed up
-                            )
+                            decisions.append((email_data['id'], action, reason))
                             
                         except Exception as e:
                             stats['errors'] += 1
@@ -2597,6 +2733,8 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                                 log_callback(f"    ❌ Error processing email: {str(e)[:100]}")
                             continue
                     
+                    self._execute_backlog_decisions(decisions, stats, log_callback)
+                    
                     # Sub-batch complete
                     if log_callback:
                         percentage = (processed_count / total_messages * 100) if total_messages > 0 else 100
@@ -2610,6 +2748,7 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
                 if not next_page_token:
                     if log_callback:
                         log_callback("🎯 All emails fetched and processed!")
+                    stats['completed'] = True
                     break
                 
                 # Very brief pause to avoid rate limits
@@ -2643,10 +2782,24 @@ Respond with JSON: {{"action": "CATEGORY", "reason": "explanation", "confidence"
             self.logger.exception("Bulk processing error")
             return stats
         finally:
+            if llm_pool is not None:
+                llm_pool.shutdown(wait=False, cancel_futures=True)
             # After processing, suggest rule updates based on the session
             self.learning_engine.suggest_rule_updates()
             self.learning_engine.detect_new_patterns()
     
+    def _execute_backlog_decisions(self, decisions, stats, log_callback=None):
+        """Apply a backlog batch's decisions together; failures count as errors."""
+        if not decisions:
+            return
+        try:
+            results = self.execute_actions_batch(decisions)
+        except Exception as e:
+            results = {}
+            if log_callback:
+                log_callback(f"    ❌ Error executing batch actions: {str(e)[:100]}")
+        stats['errors'] += sum(1 for email_id, _, _ in decisions if not results.get(email_id))
+    
     def export_subjects(self, max_emails=1000, days_back=30, output_file='email_subjects.txt'):
         """Export email subjects for analysis."""
         print(f"🔍 Exporting up to {max_emails} email subjects from the last {days_back} days...")
@@ -526,8 +526,7 @@ def update_config_from_lm_analysis(analysis_result: Dict, settings_path: str = "
         
     except Exception as e:
         logger.error(f"Failed to update config from LM analysis: {e}")
-        import traceback
-        logger.debug(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return False
 def apply_lm_studio_suggestions(suggestions: Dict) -> bool:
     """Applies suggestions from LM Studio analysis."""
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Test the Gmail quota token bucket's pacing"""
+
+import time
+import threading
+from gmail_api_utils import QuotaTokenBucket
+
+def test_oversized_acquire_waits_for_full_cost():
+    print("🧪 Testing a 500-unit acquire on a 250-unit bucket...")
+
+    limiter = QuotaTokenBucket(rate=250, capacity=250)
+    limiter.acquire(250)  # Drain the initial burst
+
+    start_time = time.monotonic()
+    limiter.acquire(500)
+    duration = time.monotonic() - start_time
+
+    # Charged in full, not capped at capacity: 500 units at 250/s is ~2s
+    assert 1.8 <= duration <= 2.5, f"waited {duration:.2f}s, expected ~2s"
+    print(f"✅ Oversized acquire waited {duration:.2f}s")
+    return True
+
+def test_debt_delays_other_callers():
+    print("🧪 Testing that other threads wait out a debt...")
+
+    limiter = QuotaTokenBucket(rate=250, capacity=250)
+    # 250 units from the bucket, then 500 units of debt (~2s)
+    worker = threading.Thread(target=limiter.acquire, args=(750,))
+    worker.start()
+    time.sleep(0.05)
+
+    start_time = time.monotonic()
+    limiter.acquire(5)
+    duration = time.monotonic() - start_time
+    worker.join()
+
+    assert 1.8 <= duration <= 2.5, f"waited {duration:.2f}s, expected ~2s"
+    print(f"✅ Concurrent acquire waited {duration:.2f}s")
+    return True
+
+if __name__ == "__main__":
+    test_oversized_acquire_waits_for_full_cost()
+    test_debt_delays_other_callers()
+    print("\n🎉 Quota bucket pacing is correct!")
@@ -35,6 +35,10 @@ from collections import Counter
 import pandas as pd
 import json
 from datetime import datetime
+try:
+    import orjson  # Optional: faster report serialization
+except ImportError:
+    orjson = None
 import sys
 import os
 
@@ -48,6 +52,9 @@ from googleapiclient.errors import HttpError
 # Initialize logger using standardized config
 logger = get_logger(__name__)
 
+# Share of the analyzed emails that suggested sender batches should cover
+SENDER_COVERAGE_TARGET = 0.8
+
 
 def _fetch_emails_in_batches(
     service: Resource, query: str, max_emails: int, batch_size: int = 100
@@ -180,10 +187,14 @@ def suggest_batch_strategies(sender_freq: Dict[str, int], total_emails: int) ->
     if total_emails == 0:
         return suggestions
 
-    # Suggest batching the most frequent senders
-    for sender, count in list(sender_freq.items())[:5]:
-        if count > 50:  # Only suggest for high-volume senders
-            suggestions.append(f'from:"{sender}"')
+    # Suggest batching the most frequent senders, highest volume first, until
+    # they cover most of the backlog
+    covered = 0
+    for sender, count in sorted(sender_freq.items(), key=lambda item: item[1], reverse=True):
+        if count <= 50 or covered >= SENDER_COVERAGE_TARGET * total_emails:
+            break  # Only suggest for high-volume senders
+        suggestions.append(f'from:"{sender}"')
+        covered += count
 
     # Suggest processing by date if there are distinct patterns (placeholder logic)
     if total_emails > 1000:
@@ -255,8 +266,12 @@ def export_analysis_report(report: Dict[str, Any], filename: str):
     logger.info(f"Exporting analysis report to {filename}...")
 
     if file_ext == 'json':
-        with open(filename, 'w') as f:
-            json.dump(report, f, indent=2)
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+        else:
+            with open(filename, 'w') as f:
+                json.dump(report, f, indent=2)
     elif file_ext == 'csv':
         # For CSV, we flatten the structure, focusing on sender frequency
         df = pd.DataFrame.from_dict(report.get("sender_frequency", {}), orient='index', columns=['count'])
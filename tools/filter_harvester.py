@@ -13,6 +13,7 @@ Key Functions:
 -   _parse_criteria: Converts filter criteria into a Gmail search query string.
 -   _parse_action: Extracts actions like adding/removing labels or marking as spam.
 -   _get_label_name_from_id: Maps label IDs to human-readable label names.
+-   iter_message_ids: Pages through the message IDs matching a search query.
 
 Dependencies:
 -   google-api-python-client
@@ -38,6 +39,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from log_config import get_logger
 from exceptions import GmailAPIError, FilterProcessingError, wrap_gmail_api_call
+from gmail_api_utils import GMAIL_QUOTA_COSTS
 
 from googleapiclient.discovery import Resource
 from googleapiclient.errors import HttpError
@@ -54,6 +56,9 @@ _label_name_to_id_cache = {}
 # Global cache for filters to avoid repeated API calls within a single run
 _filter_cache = None
 
+# Largest page messages.list allows
+MESSAGES_LIST_PAGE_SIZE = 500
+
 
 def get_and_cache_filters(service: Resource, force_refresh: bool = False) -> List[Dict[str, Any]]:
     """
@@ -399,8 +404,37 @@ def fetch_and_parse_filters(service: Resource) -> List[Dict[str, Any]]:
     return structured_filters
 
 
+def iter_message_ids(service: Resource, query: str, rate_limiter=None):
+    """
+    Yield the IDs of all messages matching a Gmail search query, page by page.
+
+    Pages are requested at the API maximum of 500 IDs (the default is 100)
+    and followed with list_next, so each ID is available as soon as its page
+    arrives.
+
+    Args:
+        service (Resource): The authenticated Gmail API service object.
+        query (str): Gmail search query.
+        rate_limiter (QuotaTokenBucket, optional): Quota limiter to wait on
+            before each page.
+
+    Raises:
+        GmailAPIError: If listing a page fails.
+    """
+    messages_api = service.users().messages()
+    request = messages_api.list(userId='me', q=query, maxResults=MESSAGES_LIST_PAGE_SIZE)
+    while request is not None:
+        if rate_limiter is not None:
+            rate_limiter.acquire(GMAIL_QUOTA_COSTS['messages.list'])
+        response = wrap_gmail_api_call(request.execute, operation=f"list messages for query '{query}'")
+        for msg in response.get('messages', []):
+            yield msg['id']
+        request = messages_api.list_next(request, response)
+
+
 def apply_existing_filters_to_backlog(service: Resource, email_ids: List[str] = None,
-                                    progress_callback=None, use_server_side=True) -> Dict[str, Any]:
+                                    progress_callback=None, use_server_side=True,
+                                    rate_limiter=None) -> Dict[str, Any]:
     """
     Applies existing Gmail filters using server-side batch operations for maximum efficiency.
     This is a complete refactor for server-side processing as per the remediation plan.
@@ -410,6 +444,9 @@ def apply_existing_filters_to_backlog(service: Resource, email_ids: List[str] =
         email_ids (List[str], optional): Legacy parameter, now ignored for server-side processing.
         progress_callback: Optional callback function for progress updates.
         use_server_side (bool): If False, this function does nothing.
+        rate_limiter (QuotaTokenBucket, optional): Quota limiter each list and
+            batchModify call waits on, so large backlogs stay under the per-user
+            rate limit instead of backing off on 429s.
 
     Returns:
         Dict[str, Any]: Statistics about filter applications including:
@@ -449,21 +486,10 @@ def apply_existing_filters_to_backlog(service: Resource, email_ids: List[str] =
         try:
             logger.info(f"Executing query for filter '{filter_id}': {query}")
             
-            # 1. Find all matching message IDs for the filter's query
-            message_ids = []
-            page_token = None
-            while True:
-                response = wrap_gmail_api_call(
-                    service.users().messages().list(userId='me', q=query, pageToken=page_token).execute,
-                    operation=f"list messages for filter '{query}'"
-                )
-                messages = response.get('messages', [])
-                if messages:
-                    message_ids.extend([msg['id'] for msg in messages])
-                
-                page_token = response.get('nextPageToken')
-                if not page_token:
-                    break
+            # 1. Find all matching message IDs for the filter's query. The
+            # list is completed before modifying anything, since changing
+            # labels mid-pagination can shift later pages of the query.
+            message_ids = list(iter_message_ids(service, query, rate_limiter=rate_limiter))
             
             if not message_ids:
                 logger.info(f"Filter '{filter_id}' did not match any messages.")
@@ -504,6 +530,8 @@ def apply_existing_filters_to_backlog(service: Resource, email_ids: List[str] =
                     }
                     
                     try:
+                        if rate_limiter is not None:
+                            rate_limiter.acquire(GMAIL_QUOTA_COSTS['messages.batchModify'])
                         wrap_gmail_api_call(
                             service.users().messages().batchModify(userId='me', body=batch_modify_body).execute,
                             operation=f"batch modify for filter '{filter_id}'"